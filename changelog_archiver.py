@@ -5,12 +5,55 @@ CHANGELOG 归档管理器
 每月自动归档 CHANGELOG，保持主文件的可读性
 """
 
+import mmap
 import os
 import re
 from datetime import datetime, timedelta
-from typing import List, Tuple
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Optional, Tuple, Union
 import calendar
 
+# 文件读写缓冲区大小（默认 8 KiB 过小，整块写入大文本时使用 1 MiB）
+IO_BUFFER_SIZE = 1024 * 1024
+
+# 预编译的正则表达式
+# 条目边界标题（字节模式，直接扫描 mmap），一次匹配同时区分两类标题：
+# 日期标题如 ## 2025-08-05 14:30:22 或 ## 2025-08-05，分组 1 捕获日期；其他 # / ## 标题结束当前条目
+HEADER_BYTES_RE = re.compile(rb'^(?:## (\d{4}-\d{2}-\d{2})|#{1,2} )', re.MULTILINE)
+# 条目中的年月，用于按月份分组
+ENTRY_DATE_RE = re.compile(r'^## (\d{4}-\d{2})-\d{2}', re.MULTILINE)
+# 统计归档文件中的条目数量
+ENTRY_COUNT_RE = re.compile(r'^## \d{4}-\d{2}-\d{2}', re.MULTILINE)
+# 归档文件头部"本月概览"中记录的条目数量
+ARCHIVE_COUNT_RE = re.compile(r'\*\*变化记录数量\*\*：(\d+) 次')
+# 读取归档文件头部的字符数，"本月概览"位于文件开头
+ARCHIVE_HEAD_SIZE = 1024
+
+def atomic_write(path: str, content: Union[str, bytes]):
+    """先写入临时文件再用 os.replace 替换，写入中断时原文件保持完整"""
+    tmp_path = path + '.tmp'
+    if isinstance(content, bytes):
+        with open(tmp_path, 'wb', buffering=IO_BUFFER_SIZE) as f:
+            f.write(content)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+            f.write(content)
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=None)
+def _month_name(month: int) -> str:
+    """月份英文名称（calendar.month_name 每次取值都会调用 strftime）"""
+    return calendar.month_name[month]
+
+
+@lru_cache(maxsize=256)
+def _days_in(year: int, month: int) -> int:
+    """指定年月的天数"""
+    return calendar.monthrange(year, month)[1]
+
+
 class ChangelogArchiver:
     def __init__(self):
         self.changelog_file = "CHANGELOG.md"
@@ -33,92 +76,82 @@ class ChangelogArchiver:
 
 {current_month_header}
 """
+        # 模板只解析一次，渲染时直接拼接
+        self._template_parts = self.header_template.split('{archive_links}')
     
     def ensure_archive_directory(self):
         """确保归档目录存在"""
-        if not os.path.exists(self.archive_dir):
+        # 直接创建，已存在时由 FileExistsError 判断，省去一次 stat
+        try:
             os.makedirs(self.archive_dir)
             print(f"✅ 创建归档目录: {self.archive_dir}")
+        except FileExistsError:
+            pass
     
-    def parse_changelog_entries(self) -> Tuple[List[str], List[str]]:
+    def parse_changelog_entries(self, now: Optional[datetime] = None) -> Tuple[List[str], List[str]]:
         """解析 CHANGELOG 中的条目，分离需要归档的和保留的"""
-        if not os.path.exists(self.changelog_file):
+        try:
+            f = open(self.changelog_file, 'rb')
+        except FileNotFoundError:
             print(f"⚠️ CHANGELOG 文件不存在: {self.changelog_file}")
             return [], []
         
-        with open(self.changelog_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 查找所有日期条目
-        # 匹配格式如: ## 2025-08-05 14:30:22 或 ## 2025-08-05
-        date_pattern = r'^## (\d{4}-\d{2}-\d{2})(?:\s+\d{2}:\d{2}:\d{2})?'
-        
-        lines = content.split('\n')
         entries_to_archive = []
         entries_to_keep = []
-        current_entry = []
-        current_date = None
-        in_entry = False
         
         # 获取当前日期和上个月的最后一天
-        now = datetime.now()
+        now = now or datetime.now()
         last_month = now.replace(day=1) - timedelta(days=1)
-        cutoff_date = last_month.replace(day=calendar.monthrange(last_month.year, last_month.month)[1])
+        cutoff_date = last_month.replace(day=_days_in(last_month.year, last_month.month))
         
         print(f"📅 归档截止日期: {cutoff_date.strftime('%Y-%m-%d')}")
         
-        i = 0
-        while i < len(lines):
-            line = lines[i]
+        with f:
+            # 空文件无法 mmap，也没有条目
+            if os.fstat(f.fileno()).st_size == 0:
+                return entries_to_archive, entries_to_keep
             
-            # 检查是否是日期标题行
-            match = re.match(date_pattern, line, re.MULTILINE)
-            if match:
-                # 保存上一个条目
-                if current_entry and current_date:
-                    entry_content = '\n'.join(current_entry)
-                    if current_date <= cutoff_date:
-                        entries_to_archive.append(entry_content)
-                    else:
-                        entries_to_keep.append(entry_content)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # 以文本模式读取时换行符会被统一为 \n，CRLF 文件的条目也需要同样处理
+                has_cr = mm.find(b'\r') != -1
                 
-                # 开始新条目
-                current_date = datetime.strptime(match.group(1), '%Y-%m-%d').date()
-                current_entry = [line]
-                in_entry = True
-            elif in_entry and (line.startswith('## ') or line.startswith('# ')):
-                # 遇到新的标题，结束当前条目
-                if current_entry and current_date:
-                    entry_content = '\n'.join(current_entry)
-                    if current_date <= cutoff_date:
+                def add_entry(entry_date, start, end):
+                    entry_content = mm[start:end].decode('utf-8')
+                    if has_cr:
+                        entry_content = entry_content.replace('\r\n', '\n').replace('\r', '\n')
+                    if entry_date <= cutoff_date:
                         entries_to_archive.append(entry_content)
                     else:
                         entries_to_keep.append(entry_content)
                 
-                # 重置状态，这行不是日期条目
-                current_entry = []
                 current_date = None
-                in_entry = False
+                current_start = 0
                 
-                # 如果这是非日期的标题，需要跳过
-                continue
-            elif in_entry:
-                # 添加到当前条目
-                current_entry.append(line)
-            
-            i += 1
-        
-        # 处理最后一个条目
-        if current_entry and current_date:
-            entry_content = '\n'.join(current_entry)
-            if current_date <= cutoff_date:
-                entries_to_archive.append(entry_content)
-            else:
-                entries_to_keep.append(entry_content)
+                # 只扫描标题行的位置，条目正文直接按偏移切片，无需逐行拆分
+                for match in HEADER_BYTES_RE.finditer(mm):
+                    # 遇到新的标题，结束当前条目（去掉标题前的换行符，CRLF 文件连同 \r 一起去掉）
+                    if current_date is not None:
+                        end = match.start() - 1
+                        if has_cr and mm[end - 1:end] == b'\r':
+                            end -= 1
+                        add_entry(current_date, current_start, end)
+                    
+                    # 只有日期标题会让分组 1 参与匹配
+                    if match.lastindex:
+                        # 开始新条目
+                        current_date = datetime.strptime(match[1].decode('ascii'), '%Y-%m-%d').date()
+                        current_start = match.start()
+                    else:
+                        # 非日期的标题，不属于任何条目
+                        current_date = None
+                
+                # 处理最后一个条目
+                if current_date is not None:
+                    add_entry(current_date, current_start, len(mm))
         
         return entries_to_archive, entries_to_keep
     
-    def create_monthly_archive(self, entries: List[str], year_month: str) -> str:
+    def create_monthly_archive(self, entries: List[str], year_month: str, now: Optional[datetime] = None) -> str:
         """创建月度归档文件"""
         if not entries:
             print(f"⚠️ {year_month} 没有需要归档的条目")
@@ -129,39 +162,39 @@ class ChangelogArchiver:
         
         # 生成归档文件内容
         year, month = year_month.split('-')
-        month_name = calendar.month_name[int(month)]
+        month_name = _month_name(int(month))
+        days_in_month = _days_in(int(year), int(month))
+        archived_at = (now or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
         
-        archive_content = f"""# Spotify 价格变化记录 - {year}年{month}月
+        header = f"""# Spotify 价格变化记录 - {year}年{month}月
 
 > 📁 **归档说明**：本文件包含 {year}年{month}月 ({month_name}) 的所有价格变化记录。
 
 ## 📊 本月概览
 
-- **记录时间范围**：{year}-{month}-01 至 {year}-{month}-{calendar.monthrange(int(year), int(month))[1]}
+- **记录时间范围**：{year}-{month}-01 至 {year}-{month}-{days_in_month}
 - **变化记录数量**：{len(entries)} 次
-- **归档日期**：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+- **归档日期**：{archived_at}
 
 ---
 
 """
         
-        # 添加所有条目
-        for entry in entries:
-            archive_content += entry + "\n\n"
-        
         # 添加页脚
-        archive_content += f"""---
+        footer = f"""---
 
 📚 **相关链接**：
 - [返回主 CHANGELOG](../CHANGELOG.md)
 - [查看其他月份归档](./)
 
-*此文件由自动归档系统生成于 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*
+*此文件由自动归档系统生成于 {archived_at}*
 """
         
+        # 拼接标题、所有条目和页脚
+        archive_content = header + ''.join(entry + "\n\n" for entry in entries) + footer
+        
         # 写入归档文件
-        with open(archive_path, 'w', encoding='utf-8') as f:
-            f.write(archive_content)
+        atomic_write(archive_path, archive_content)
         
         print(f"✅ 创建月度归档: {archive_path} ({len(entries)} 个条目)")
         return archive_filename
@@ -176,23 +209,29 @@ class ChangelogArchiver:
         # 扫描归档目录
         for filename in os.listdir(self.archive_dir):
             if filename.startswith('changelog_') and filename.endswith('.md'):
-                # 提取年月信息
-                year_month = filename.replace('changelog_', '').replace('.md', '')
-                if re.match(r'\d{4}-\d{2}', year_month):
+                # 提取年月信息，格式为 YYYY-MM
+                year_month = filename[len('changelog_'):-len('.md')]
+                if (len(year_month) == 7 and year_month[4] == '-'
+                        and year_month[:4].isdigit() and year_month[5:].isdigit()):
                     # 统计该归档文件中的条目数量
                     archive_path = os.path.join(self.archive_dir, filename)
                     try:
                         with open(archive_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        # 统计 ## YYYY-MM-DD 格式的条目
-                        entry_count = len(re.findall(r'^## \d{4}-\d{2}-\d{2}', content, re.MULTILINE))
+                            # 条目数量在创建归档时已写入头部，只需读取开头部分
+                            head = f.read(ARCHIVE_HEAD_SIZE)
+                            count_match = ARCHIVE_COUNT_RE.search(head)
+                            if count_match:
+                                entry_count = int(count_match.group(1))
+                            else:
+                                # 头部缺少记录时，统计 ## YYYY-MM-DD 格式的条目
+                                entry_count = len(ENTRY_COUNT_RE.findall(head + f.read()))
                         archives.append((year_month, filename, entry_count))
                     except Exception as e:
                         print(f"⚠️ 读取归档文件失败: {filename} - {e}")
                         archives.append((year_month, filename, 0))
         
         # 按年月排序（最新的在前）
-        archives.sort(key=lambda x: x[0], reverse=True)
+        archives.sort(key=itemgetter(0), reverse=True)
         return archives
     
     def generate_archive_links(self, archives: List[Tuple[str, str, int]]) -> str:
@@ -203,57 +242,58 @@ class ChangelogArchiver:
         links = []
         for year_month, filename, count in archives:
             year, month = year_month.split('-')
-            month_name = calendar.month_name[int(month)]
             display_name = f"{year}年{month}月"
             link = f"| {display_name} | [changelog_{year_month}.md]({self.archive_dir}/{filename}) | {count} |"
             links.append(link)
         
         return '\n'.join(links)
     
-    def update_main_changelog(self, entries_to_keep: List[str], new_archives: List[str]):
+    def render_header(self, archive_links: str, current_month_header: str) -> str:
+        """渲染 CHANGELOG 头部（归档链接表格和当前月份标题）"""
+        before_links, after_links = self._template_parts
+        return before_links + archive_links + after_links.replace('{current_month_header}', current_month_header)
+    
+    def update_main_changelog(self, entries_to_keep: List[str], new_archives: List[str], now: Optional[datetime] = None):
         """更新主 CHANGELOG 文件"""
         # 获取所有归档信息
         existing_archives = self.get_existing_archives()
         archive_links = self.generate_archive_links(existing_archives)
         
         # 生成当前月份标题
-        now = datetime.now()
+        now = now or datetime.now()
         current_month_header = f"### {now.strftime('%Y年%m月')}"
         
         # 生成新的 CHANGELOG 内容
-        new_content = self.header_template.format(
-            archive_links=archive_links,
-            current_month_header=current_month_header
-        )
+        new_content = self.render_header(archive_links, current_month_header)
         
         # 添加保留的条目
         if entries_to_keep:
-            for entry in entries_to_keep:
-                new_content += entry + "\n\n"
+            new_content += ''.join(entry + "\n\n" for entry in entries_to_keep)
         else:
             new_content += "\n*本月暂无价格变化记录*\n\n"
         
         # 写入文件
-        with open(self.changelog_file, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        atomic_write(self.changelog_file, new_content)
         
         print(f"✅ 更新主 CHANGELOG: {self.changelog_file}")
     
-    def should_archive(self) -> bool:
+    def should_archive(self, now: Optional[datetime] = None) -> bool:
         """判断是否应该执行归档（月初几天内）"""
-        now = datetime.now()
+        now = now or datetime.now()
         # 在每月的前3天内执行归档
         return now.day <= 3
     
-    def archive_last_month(self) -> Tuple[int, List[str]]:
+    def archive_last_month(self, now: Optional[datetime] = None) -> Tuple[int, List[str]]:
         """归档上个月的记录"""
         print("🗂️ 开始执行 CHANGELOG 月度归档...")
+        # 本次归档统一使用同一个时间点
+        now = now or datetime.now()
         
         # 确保归档目录存在
         self.ensure_archive_directory()
         
         # 解析现有记录
-        entries_to_archive, entries_to_keep = self.parse_changelog_entries()
+        entries_to_archive, entries_to_keep = self.parse_changelog_entries(now)
         
         if not entries_to_archive:
             print("📝 没有需要归档的历史记录")
@@ -263,7 +303,7 @@ class ChangelogArchiver:
         monthly_entries = {}
         for entry in entries_to_archive:
             # 提取日期
-            match = re.search(r'^## (\d{4}-\d{2})-\d{2}', entry, re.MULTILINE)
+            match = ENTRY_DATE_RE.search(entry)
             if match:
                 year_month = match.group(1)
                 if year_month not in monthly_entries:
@@ -275,31 +315,31 @@ class ChangelogArchiver:
         total_archived = 0
         
         for year_month, entries in monthly_entries.items():
-            archive_filename = self.create_monthly_archive(entries, year_month)
+            archive_filename = self.create_monthly_archive(entries, year_month, now)
             if archive_filename:
                 archived_files.append(archive_filename)
                 total_archived += len(entries)
         
         # 更新主 CHANGELOG
-        self.update_main_changelog(entries_to_keep, archived_files)
+        self.update_main_changelog(entries_to_keep, archived_files, now)
         
         print(f"🎉 归档完成！共归档 {total_archived} 个条目到 {len(archived_files)} 个文件")
         return total_archived, archived_files
 
 
-def main():
+def main(now: Optional[datetime] = None):
     """主函数"""
     archiver = ChangelogArchiver()
+    now = now or datetime.now()
     
     # 检查是否应该执行归档
-    if not archiver.should_archive():
-        now = datetime.now()
+    if not archiver.should_archive(now):
         print(f"⏰ 当前日期 {now.strftime('%Y-%m-%d')} 不在归档窗口期（每月1-3日）")
         print("跳过归档操作")
         return
     
     # 执行归档
-    archived_count, archived_files = archiver.archive_last_month()
+    archived_count, archived_files = archiver.archive_last_month(now)
     
     # 输出结果供 GitHub Actions 使用
     github_output = os.environ.get('GITHUB_OUTPUT')
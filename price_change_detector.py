@@ -5,13 +5,27 @@ Spotify价格变化检测器
 检测最新价格与上次价格的变化，生成changelog
 """
 
-import json
 import os
 import re
 from datetime import datetime
+from operator import itemgetter
 from typing import Dict, List, Tuple, Optional
 import glob
 
+import orjson
+
+from changelog_archiver import IO_BUFFER_SIZE, ChangelogArchiver, atomic_write
+from changelog_archiver import main as run_changelog_archiver
+
+# 预编译的正则表达式
+# 月份标题，如: ### 2025年08月
+MONTH_HEADER_RE = re.compile(r'\n### \d{4}年\d{2}月')
+# "暂无记录"占位文本
+NO_RECORD_RE = re.compile(r'\n\*本月暂无价格变化记录\*\s*')
+
+# 按涨跌幅排序的 key（C 实现，比 lambda 更快）
+CHANGE_PERCENT_KEY = itemgetter('change_percent')
+
 class PriceChangeDetector:
     def __init__(self):
         self.current_file = "spotify_prices_cny_sorted.json"
@@ -21,209 +35,201 @@ class PriceChangeDetector:
         """查找最新的归档价格文件"""
         # 查找archive目录下的所有cny_sorted文件
         pattern = "archive/**/spotify_prices_cny_sorted_*.json"
-        archive_files = glob.glob(pattern, recursive=True)
         
-        if not archive_files:
+        # 按文件名中的时间戳取最新的，流式遍历无需构建并排序完整列表
+        latest_file = max(glob.iglob(pattern, recursive=True),
+                          key=lambda x: os.path.basename(x).split('_')[-1],
+                          default=None)
+        
+        if latest_file is None:
             print("没有找到历史归档文件")
             return None
             
-        # 按文件名中的时间戳排序，获取最新的
-        archive_files.sort(key=lambda x: os.path.basename(x).split('_')[-1])
-        latest_file = archive_files[-1]
         print(f"找到最新归档文件: {latest_file}")
         return latest_file
     
+    def write_json(self, file_path: str, data: Dict):
+        """写入 JSON 文件"""
+        atomic_write(file_path, orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    
     def load_price_data(self, file_path: str) -> Dict:
         """加载价格数据"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(file_path, 'rb', buffering=IO_BUFFER_SIZE) as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             print(f"文件不存在: {file_path}")
             return {}
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print(f"JSON格式错误: {file_path}")
             return {}
     
-    def compare_prices(self, old_data: Dict, new_data: Dict) -> List[Dict]:
-        """对比价格变化"""
-        changes = []
-        
-        # 创建以国家-计划为key的字典，便于对比
-        old_prices = {}
-        new_prices = {}
-        
-        # 处理旧数据
-        for country, plans in old_data.items():
+    @staticmethod
+    def _iter_plan_prices(data: Dict):
+        """遍历数据中所有带 price_cny 的 (国家, 套餐, 套餐数据)"""
+        for country, plans in data.items():
             if isinstance(plans, dict):
                 for plan_name, plan_data in plans.items():
                     if isinstance(plan_data, dict) and 'price_cny' in plan_data:
-                        key = f"{country}_{plan_name}"
-                        old_prices[key] = {
-                            'country': country,
-                            'plan': plan_name,
-                            'price_cny': plan_data['price_cny'],
-                            'price_original': plan_data.get('price_original', 'N/A'),
-                            'currency': plan_data.get('currency', 'N/A')
-                        }
+                        yield country, plan_name, plan_data
+    
+    def compare_prices(self, old_data: Dict, new_data: Dict) -> List[Dict]:
+        """对比价格变化"""
+        changes = []
         
-        # 处理新数据
-        for country, plans in new_data.items():
-            if isinstance(plans, dict):
-                for plan_name, plan_data in plans.items():
-                    if isinstance(plan_data, dict) and 'price_cny' in plan_data:
-                        key = f"{country}_{plan_name}"
-                        new_prices[key] = {
-                            'country': country,
-                            'plan': plan_name,
-                            'price_cny': plan_data['price_cny'],
-                            'price_original': plan_data.get('price_original', 'N/A'),
-                            'currency': plan_data.get('currency', 'N/A')
-                        }
+        # 旧数据只展平一次：(国家, 套餐) -> (CNY 价格, 套餐数据)，之后每次对比只需一次查找
+        old_prices = {
+            (country, plan_name): (float(plan_data['price_cny']), plan_data)
+            for country, plan_name, plan_data in self._iter_plan_prices(old_data)
+        }
+        # 新数据中出现过的 (国家, 套餐)，用于检查删除的套餐
+        new_keys = set()
         
         # 对比价格变化
-        for key, new_price in new_prices.items():
-            if key in old_prices:
-                old_price = old_prices[key]
-                old_cny = float(old_price['price_cny'])
-                new_cny = float(new_price['price_cny'])
+        for country, plan_name, new_plan in self._iter_plan_prices(new_data):
+            key = (country, plan_name)
+            new_keys.add(key)
+            new_cny = float(new_plan['price_cny'])
+            old_entry = old_prices.get(key)
+            
+            if old_entry is not None:
+                old_cny = old_entry[0]
                 
                 if abs(old_cny - new_cny) > 0.01:  # 价格变化超过0.01元
                     change_amount = new_cny - old_cny
                     change_percent = (change_amount / old_cny) * 100 if old_cny > 0 else 0
                     
                     changes.append({
-                        'country': new_price['country'],
-                        'plan': new_price['plan'],
+                        'country': country,
+                        'plan': plan_name,
                         'old_price_cny': old_cny,
                         'new_price_cny': new_cny,
                         'change_amount': change_amount,
                         'change_percent': change_percent,
-                        'price_original': new_price['price_original'],
-                        'currency': new_price['currency'],
+                        'price_original': new_plan.get('price_original', 'N/A'),
+                        'currency': new_plan.get('currency', 'N/A'),
                         'type': 'price_change'
                     })
             else:
                 # 新增的套餐
                 changes.append({
-                    'country': new_price['country'],
-                    'plan': new_price['plan'],
-                    'new_price_cny': float(new_price['price_cny']),
-                    'price_original': new_price['price_original'],
-                    'currency': new_price['currency'],
+                    'country': country,
+                    'plan': plan_name,
+                    'new_price_cny': new_cny,
+                    'price_original': new_plan.get('price_original', 'N/A'),
+                    'currency': new_plan.get('currency', 'N/A'),
                     'type': 'new_plan'
                 })
         
         # 检查删除的套餐
-        for key, old_price in old_prices.items():
-            if key not in new_prices:
+        for (country, plan_name), (old_cny, old_plan) in old_prices.items():
+            if (country, plan_name) not in new_keys:
                 changes.append({
-                    'country': old_price['country'],
-                    'plan': old_price['plan'],
-                    'old_price_cny': float(old_price['price_cny']),
-                    'price_original': old_price['price_original'],
-                    'currency': old_price['currency'],
+                    'country': country,
+                    'plan': plan_name,
+                    'old_price_cny': old_cny,
+                    'price_original': old_plan.get('price_original', 'N/A'),
+                    'currency': old_plan.get('currency', 'N/A'),
                     'type': 'removed_plan'
                 })
         
         return changes
     
+    def categorize_changes(self, changes: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict], List[Dict]]:
+        """单次遍历将变化分为涨价、降价、新增、移除四类"""
+        price_increases, price_decreases, new_plans, removed_plans = [], [], [], []
+        for change in changes:
+            change_type = change['type']
+            if change_type == 'price_change':
+                if change['change_amount'] > 0:
+                    price_increases.append(change)
+                elif change['change_amount'] < 0:
+                    price_decreases.append(change)
+            elif change_type == 'new_plan':
+                new_plans.append(change)
+            elif change_type == 'removed_plan':
+                removed_plans.append(change)
+        return price_increases, price_decreases, new_plans, removed_plans
+    
     def generate_changelog_content(self, changes: List[Dict], date: str) -> str:
         """生成changelog内容"""
         if not changes:
             return f"## {date}\n\n✅ **无价格变化** - 所有套餐价格保持稳定\n\n"
         
-        content = f"## {date}\n\n"
+        parts: List[str] = [f"## {date}\n\n"]
+        add = parts.append  # 循环内频繁调用，绑定为局部变量
         
         # 统计变化
-        price_increases = [c for c in changes if c['type'] == 'price_change' and c['change_amount'] > 0]
-        price_decreases = [c for c in changes if c['type'] == 'price_change' and c['change_amount'] < 0]
-        new_plans = [c for c in changes if c['type'] == 'new_plan']
-        removed_plans = [c for c in changes if c['type'] == 'removed_plan']
+        price_increases, price_decreases, new_plans, removed_plans = self.categorize_changes(changes)
         
-        content += f"📊 **变化概览**: {len(changes)} 项变化\n"
+        add(f"📊 **变化概览**: {len(changes)} 项变化\n")
         if price_increases:
-            content += f"- 📈 涨价: {len(price_increases)} 个套餐\n"
+            add(f"- 📈 涨价: {len(price_increases)} 个套餐\n")
         if price_decreases:
-            content += f"- 📉 降价: {len(price_decreases)} 个套餐\n"
+            add(f"- 📉 降价: {len(price_decreases)} 个套餐\n")
         if new_plans:
-            content += f"- 🆕 新增: {len(new_plans)} 个套餐\n"
+            add(f"- 🆕 新增: {len(new_plans)} 个套餐\n")
         if removed_plans:
-            content += f"- ❌ 移除: {len(removed_plans)} 个套餐\n"
-        content += "\n"
+            add(f"- ❌ 移除: {len(removed_plans)} 个套餐\n")
+        add("\n")
         
         # 涨价详情
         if price_increases:
-            content += "### 📈 价格上涨\n\n"
-            price_increases.sort(key=lambda x: x['change_percent'], reverse=True)
+            add("### 📈 价格上涨\n\n")
+            price_increases.sort(key=CHANGE_PERCENT_KEY, reverse=True)
             for change in price_increases:
-                content += f"- **{change['country']} - {change['plan']}**\n"
-                content += f"  - 原价: ¥{change['old_price_cny']:.2f} | 现价: ¥{change['new_price_cny']:.2f}\n"
-                content += f"  - 涨幅: ¥{change['change_amount']:.2f} (+{change['change_percent']:.1f}%)\n"
-                content += f"  - 当地价格: {change['price_original']} {change['currency']}\n\n"
+                add(f"- **{change['country']} - {change['plan']}**\n"
+                    f"  - 原价: ¥{change['old_price_cny']:.2f} | 现价: ¥{change['new_price_cny']:.2f}\n"
+                    f"  - 涨幅: ¥{change['change_amount']:.2f} (+{change['change_percent']:.1f}%)\n"
+                    f"  - 当地价格: {change['price_original']} {change['currency']}\n\n")
         
         # 降价详情
         if price_decreases:
-            content += "### 📉 价格下降\n\n"
-            price_decreases.sort(key=lambda x: x['change_percent'])
+            add("### 📉 价格下降\n\n")
+            price_decreases.sort(key=CHANGE_PERCENT_KEY)
             for change in price_decreases:
-                content += f"- **{change['country']} - {change['plan']}**\n"
-                content += f"  - 原价: ¥{change['old_price_cny']:.2f} | 现价: ¥{change['new_price_cny']:.2f}\n"
-                content += f"  - 降幅: ¥{abs(change['change_amount']):.2f} ({change['change_percent']:.1f}%)\n"
-                content += f"  - 当地价格: {change['price_original']} {change['currency']}\n\n"
+                add(f"- **{change['country']} - {change['plan']}**\n"
+                    f"  - 原价: ¥{change['old_price_cny']:.2f} | 现价: ¥{change['new_price_cny']:.2f}\n"
+                    f"  - 降幅: ¥{abs(change['change_amount']):.2f} ({change['change_percent']:.1f}%)\n"
+                    f"  - 当地价格: {change['price_original']} {change['currency']}\n\n")
         
         # 新增套餐
         if new_plans:
-            content += "### 🆕 新增套餐\n\n"
+            add("### 🆕 新增套餐\n\n")
             for change in new_plans:
-                content += f"- **{change['country']} - {change['plan']}**\n"
-                content += f"  - 价格: ¥{change['new_price_cny']:.2f}\n"
-                content += f"  - 当地价格: {change['price_original']} {change['currency']}\n\n"
+                add(f"- **{change['country']} - {change['plan']}**\n"
+                    f"  - 价格: ¥{change['new_price_cny']:.2f}\n"
+                    f"  - 当地价格: {change['price_original']} {change['currency']}\n\n")
         
         # 移除套餐
         if removed_plans:
-            content += "### ❌ 移除套餐\n\n"
+            add("### ❌ 移除套餐\n\n")
             for change in removed_plans:
-                content += f"- **{change['country']} - {change['plan']}**\n"
-                content += f"  - 原价格: ¥{change['old_price_cny']:.2f}\n"
-                content += f"  - 当地价格: {change['price_original']} {change['currency']}\n\n"
+                add(f"- **{change['country']} - {change['plan']}**\n"
+                    f"  - 原价格: ¥{change['old_price_cny']:.2f}\n"
+                    f"  - 当地价格: {change['price_original']} {change['currency']}\n\n")
         
-        return content
+        return ''.join(parts)
     
-    def update_changelog(self, new_content: str):
+    def update_changelog(self, new_content: str, now: Optional[datetime] = None):
         """更新changelog文件"""
-        if not os.path.exists(self.changelog_file):
+        current_month = (now or datetime.now()).strftime('%Y年%m月')
+        
+        # 读取现有内容，直接打开而不是先检查文件是否存在
+        try:
+            with open(self.changelog_file, 'r', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+                existing_content = f.read()
+        except FileNotFoundError:
             # 如果文件不存在，创建初始模板
-            initial_content = """# Spotify 价格变化记录
-
-此文件记录 Spotify 各国套餐价格的变化历史。
-
-> 📊 **说明**：价格变化自动检测功能已启用，每次爬虫运行后都会对比上次的价格数据，生成详细的变化报告。
-
-## 📁 历史归档
-
-| 年月 | 归档文件 | 变化次数 |
-|------|----------|----------|
-| - | 暂无归档 | - |
-
----
-
-## 📅 当前月份记录
-
-### """ + datetime.now().strftime('%Y年%m月') + """
-
-"""
-            with open(self.changelog_file, 'w', encoding='utf-8') as f:
-                f.write(initial_content + new_content + "\n")
+            # 与归档器共用同一份头部模板
+            archiver = ChangelogArchiver()
+            initial_content = archiver.render_header(archiver.generate_archive_links([]),
+                                                     f"### {current_month}") + "\n"
+            atomic_write(self.changelog_file, initial_content + new_content + "\n")
             print(f"✅ 创建新的 Changelog: {self.changelog_file}")
             return
         
-        # 读取现有内容
-        with open(self.changelog_file, 'r', encoding='utf-8') as f:
-            existing_content = f.read()
-        
         # 查找当前月份记录的位置
-        current_month = datetime.now().strftime('%Y年%m月')
         month_header_pattern = f"### {current_month}"
         
         if month_header_pattern in existing_content:
@@ -232,7 +238,7 @@ class PriceChangeDetector:
             if len(parts) == 2:
                 # 查找下一个月份标题或文件结束
                 after_header = parts[1]
-                next_month_match = re.search(r'\n### \d{4}年\d{2}月', after_header)
+                next_month_match = MONTH_HEADER_RE.search(after_header)
                 
                 if next_month_match:
                     # 在下一个月份标题前插入
@@ -243,7 +249,7 @@ class PriceChangeDetector:
                 else:
                     # 在文件末尾插入
                     # 清理现有的"暂无记录"文本
-                    cleaned_after = re.sub(r'\n\*本月暂无价格变化记录\*\s*', '\n', after_header)
+                    cleaned_after = NO_RECORD_RE.sub('\n', after_header)
                     updated_content = parts[0] + month_header_pattern + "\n\n" + new_content + cleaned_after
             else:
                 updated_content = existing_content + "\n" + new_content
@@ -251,27 +257,30 @@ class PriceChangeDetector:
             # 添加新月份标题和内容
             updated_content = existing_content + f"\n### {current_month}\n\n" + new_content
         
-        with open(self.changelog_file, 'w', encoding='utf-8') as f:
-            f.write(updated_content)
+        atomic_write(self.changelog_file, updated_content)
         
         print(f"✅ Changelog已更新: {self.changelog_file}")
     
-    def generate_summary_json(self, changes: List[Dict], date: str):
+    def generate_summary_json(self, changes: List[Dict], date: str, now: Optional[datetime] = None,
+                              note: Optional[str] = None):
         """生成变化摘要JSON文件"""
+        now = now or datetime.now()
+        price_increases, price_decreases, new_plans, removed_plans = self.categorize_changes(changes)
         summary = {
             'date': date,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
             'total_changes': len(changes),
-            'price_increases': len([c for c in changes if c['type'] == 'price_change' and c['change_amount'] > 0]),
-            'price_decreases': len([c for c in changes if c['type'] == 'price_change' and c['change_amount'] < 0]),
-            'new_plans': len([c for c in changes if c['type'] == 'new_plan']),
-            'removed_plans': len([c for c in changes if c['type'] == 'removed_plan']),
+            'price_increases': len(price_increases),
+            'price_decreases': len(price_decreases),
+            'new_plans': len(new_plans),
+            'removed_plans': len(removed_plans),
             'changes': changes
         }
+        if note:
+            summary['note'] = note
         
-        summary_file = f"price_changes_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, ensure_ascii=False, indent=2)
+        summary_file = f"price_changes_summary_{now.strftime('%Y%m%d_%H%M%S')}.json"
+        self.write_json(summary_file, summary)
         
         print(f"✅ 变化摘要已生成: {summary_file}")
         return summary_file
@@ -279,6 +288,9 @@ class PriceChangeDetector:
     def detect_and_report_changes(self) -> Tuple[int, str]:
         """主函数：检测价格变化并生成报告"""
         print("🔍 开始检测价格变化...")
+        # 本次检测统一使用同一个时间点
+        now = datetime.now()
+        date = now.strftime('%Y-%m-%d %H:%M:%S')
         
         # 检查当前价格文件是否存在
         if not os.path.exists(self.current_file):
@@ -290,22 +302,7 @@ class PriceChangeDetector:
         if not latest_archive:
             print("⚠️ 没有历史数据，跳过价格对比")
             # 即使没有历史数据，也生成一个空的摘要文件
-            date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            summary = {
-                'date': date,
-                'timestamp': datetime.now().isoformat(),
-                'total_changes': 0,
-                'price_increases': 0,
-                'price_decreases': 0,
-                'new_plans': 0,
-                'removed_plans': 0,
-                'changes': [],
-                'note': '首次运行或无历史数据，跳过价格对比'
-            }
-            summary_file = f"price_changes_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(summary_file, 'w', encoding='utf-8') as f:
-                json.dump(summary, f, ensure_ascii=False, indent=2)
-            print(f"✅ 生成初始摘要文件: {summary_file}")
+            summary_file = self.generate_summary_json([], date, now, note='首次运行或无历史数据，跳过价格对比')
             return 0, summary_file
         
         # 加载数据
@@ -320,14 +317,13 @@ class PriceChangeDetector:
         changes = self.compare_prices(old_data, new_data)
         
         # 生成报告
-        date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         changelog_content = self.generate_changelog_content(changes, date)
         
         # 更新changelog
-        self.update_changelog(changelog_content)
+        self.update_changelog(changelog_content, now)
         
         # 生成摘要JSON
-        summary_file = self.generate_summary_json(changes, date)
+        summary_file = self.generate_summary_json(changes, date, now)
         
         print(f"✅ 价格变化检测完成，发现 {len(changes)} 项变化")
         return len(changes), summary_file
@@ -338,20 +334,14 @@ if __name__ == "__main__":
     changes_count, summary_file = detector.detect_and_report_changes()
     
     # 检查是否需要执行 CHANGELOG 归档
-    from datetime import datetime
     now = datetime.now()
     if now.day <= 3:  # 每月前3天检查归档
         print("\n🗂️ 检查 CHANGELOG 归档需求...")
         try:
-            import subprocess
-            result = subprocess.run(['python', 'changelog_archiver.py'], 
-                                  capture_output=True, text=True, encoding='utf-8')
-            if result.returncode == 0:
-                print("✅ CHANGELOG 归档检查完成")
-                if result.stdout:
-                    print(result.stdout)
-            else:
-                print(f"⚠️ CHANGELOG 归档失败: {result.stderr}")
+            # 直接在当前进程中执行归档器的 main，无需再启动一个 Python 解释器；
+            # archived_count / archived_files 仍由它写入 GITHUB_OUTPUT
+            run_changelog_archiver(now)
+            print("✅ CHANGELOG 归档检查完成")
         except Exception as e:
             print(f"⚠️ 执行 CHANGELOG 归档时出错: {e}")
     
@@ -7,15 +7,50 @@ Spotify Premium Family 各国价格爬取脚本（Playwright版本）
 """
 
 import re
+import argparse
 import asyncio
 import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
 import os
 import shutil
-from typing import Any, Dict, List, Optional
+import gzip
+import sys
+from functools import lru_cache
+from queue import SimpleQueue
+from typing import Any, Dict, List, Optional, Tuple
 from bs4 import BeautifulSoup, Tag
-from playwright.async_api import async_playwright, Browser, Page
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 import time
 import random
+from collections import Counter, deque
+import requests
+import orjson
+
+from changelog_archiver import atomic_write
+
+# 逐个套餐的解析细节走 DEBUG 日志，默认 INFO 级别下不产生输出开销
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml  # noqa: F401
+    # lxml 使用 C 实现的 libxml2 解析，比纯 Python 的 html.parser 快数倍
+    HTML_PARSER = 'lxml'
+except ImportError:
+    # lxml 不是必需的依赖，缺失时回退到标准库 html.parser
+    HTML_PARSER = 'html.parser'
+
+try:
+    import uvloop
+except ImportError:
+    # uvloop 不是必需的依赖（也不支持 Windows），缺失时使用标准库默认事件循环
+    uvloop = None
+
+# 预编译价格提取用到的正则，避免每次调用都重新解析超长的货币交替模式
+# 匹配货币符号(如USD, $, €等)后跟数字的模式
+_CURRENCY_RE = re.compile(r'([$]|US[$]|CA[$]|A[$]|S[$]|HK[$]|MX[$]|NZ[$]|NT[$]|R[$]|C[$]|USD|EUR|GBP|CAD|AUD|SGD|HKD|MXN|BRL|JPY|CNY|KRW|INR|THB|MYR|IDR|PHP|VND|TWD|CHF|SEK|NOK|DKK|PLN|CZK|HUF|RON|BGN|HRK|RSD|BAM|MKD|ALL|MDL|UAH|BYN|RUB|GEL|AMD|AZN|KGS|KZT|UZS|TJS|TMT|AFN|PKR|LKR|BDT|BTN|NPR|MVR|IRR|IQD|JOD|KWD|BHD|QAR|SAR|AED|OMR|YER|EGP|LBP|SYP|TND|DZD|MAD|LYD|SDG|SOS|ETB|ERN|DJF|KMF|SCR|MUR|MGA|MWK|ZMW|BWP|SZL|LSL|ZAR|NAD|AOA|XAF|XOF|XPF|NZD|FJD|TOP|WST|VUV|SBD|PGK|NCF|TVD|KID|MHD|PWD|FMD|GHS|NGN|LRD|SLL|GMD|GNF|CIV|BFA|MLI|NER|TCD|CMR|GAB|GNQ|COG|CAF|TZS|KES|UGX|RWF|BIF|MZN|ZWL|€|£|¥|￥|₹|₱|₪|₨|₦|₵|₡|₩|₴|₽|₺|zł|Kč|Ft|kr)\s+([\d,\.]+)', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'[\d,.]+')
+_DIGIT_RE = re.compile(r'\d')
 
 def extract_year_from_timestamp(timestamp: str) -> str:
     """从时间戳中提取年份"""
@@ -33,9 +68,12 @@ def create_archive_directory_structure(archive_dir: str, timestamp: str) -> str:
     """根据时间戳创建按年份组织的归档目录结构"""
     year = extract_year_from_timestamp(timestamp)
     year_dir = os.path.join(archive_dir, year)
-    if not os.path.exists(year_dir):
+    try:
         os.makedirs(year_dir)
-        print(f"📁 创建年份目录: {year_dir}")
+    except FileExistsError:
+        pass
+    else:
+        logger.info("📁 创建年份目录: %s", year_dir)
     return year_dir
 
 def migrate_existing_archive_files(archive_dir: str):
@@ -45,84 +83,161 @@ def migrate_existing_archive_files(archive_dir: str):
     
     migrated_count = 0
     
-    # 查找根目录下的归档文件
-    for filename in os.listdir(archive_dir):
-        if filename.startswith('spotify_prices_all_countries_') and filename.endswith('.json'):
-            file_path = os.path.join(archive_dir, filename)
-            
-            # 确保是文件而不是目录
-            if os.path.isfile(file_path):
-                # 从文件名提取时间戳
-                try:
-                    # 文件名格式: spotify_prices_all_countries_YYYYMMDD_HHMMSS.json
-                    timestamp_part = filename.replace('spotify_prices_all_countries_', '').replace('.json', '')
-                    year = extract_year_from_timestamp(timestamp_part)
-                    
-                    # 创建年份目录
-                    year_dir = create_archive_directory_structure(archive_dir, timestamp_part)
-                    
-                    # 移动文件
-                    new_path = os.path.join(year_dir, filename)
-                    if not os.path.exists(new_path):  # 避免重复移动
-                        shutil.move(file_path, new_path)
-                        print(f"📦 迁移文件: {filename} → {year}/")
-                        migrated_count += 1
-                except Exception as e:
-                    print(f"⚠️  迁移文件失败 {filename}: {e}")
+    # 查找根目录下的归档文件（先收集再移动，避免边遍历边修改目录）
+    with os.scandir(archive_dir) as it:
+        entries = [entry for entry in it
+                   if entry.name.startswith('spotify_prices_all_countries_') and entry.name.endswith('.json')]
     
+    for entry in entries:
+        filename = entry.name
+        file_path = entry.path
+        
+        # 确保是文件而不是目录
+        if entry.is_file():
+            # 从文件名提取时间戳
+            try:
+                # 文件名格式: spotify_prices_all_countries_YYYYMMDD_HHMMSS.json
+                timestamp_part = filename.replace('spotify_prices_all_countries_', '').replace('.json', '')
+                year = extract_year_from_timestamp(timestamp_part)
+                
+                # 创建年份目录
+                year_dir = create_archive_directory_structure(archive_dir, timestamp_part)
+                
+                # 移动文件
+                new_path = os.path.join(year_dir, filename)
+                if not os.path.exists(new_path):  # 避免重复移动
+                    shutil.move(file_path, new_path)
+                    logger.info("📦 迁移文件: %s → %s/", filename, year)
+                    migrated_count += 1
+            except Exception as e:
+                logger.warning("⚠️  迁移文件失败 %s: %s", filename, e)
+
     if migrated_count > 0:
-        print(f"✅ 成功迁移 {migrated_count} 个归档文件到年份目录")
+        logger.info("✅ 成功迁移 %s 个归档文件到年份目录", migrated_count)
     else:
-        print("📂 没有需要迁移的归档文件")
+        logger.info("📂 没有需要迁移的归档文件")
+
+# 归档统计缓存：年份目录路径 -> (目录 mtime, 按时间倒序的文件列表)
+_STATS_CACHE: Dict[str, Tuple[int, Tuple[Tuple[str, float, str], ...]]] = {}
+
+# 归档索引文件，持久化 _STATS_CACHE，下次运行时未变化的年份目录无需重新遍历
+ARCHIVE_INDEX_FILE = '.archive_index.json'
+
+def get_archive_index_path(archive_dir: str) -> str:
+    return os.path.join(archive_dir, ARCHIVE_INDEX_FILE)
 
-def get_archive_statistics(archive_dir: str) -> dict:
-    """获取归档文件统计信息"""
+def load_archive_index(archive_dir: str):
+    """把归档索引载入统计缓存，索引不存在或损坏时忽略"""
+    try:
+        with open(get_archive_index_path(archive_dir), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        for item_path, (dir_mtime, year_files) in index.items():
+            _STATS_CACHE.setdefault(item_path, (dir_mtime, tuple(tuple(entry) for entry in year_files)))
+    except (OSError, ValueError, TypeError):
+        pass
+
+def save_archive_index(archive_dir: str):
+    """原子写入归档索引，写入失败不影响统计结果"""
+    try:
+        atomic_write(get_archive_index_path(archive_dir), json.dumps(_STATS_CACHE, ensure_ascii=False))
+    except OSError as e:
+        logger.warning("⚠️  写入归档索引失败: %s", e)
+
+def get_archive_statistics(archive_dir: str, rescan: bool = False) -> dict:
+    """获取归档文件统计信息，rescan 为 True 时忽略归档索引重新遍历所有年份目录"""
     if not os.path.exists(archive_dir):
         return {"total_files": 0, "years": {}}
     
+    if rescan:
+        _STATS_CACHE.clear()
+    elif not _STATS_CACHE:
+        load_archive_index(archive_dir)
+    
     stats = {"total_files": 0, "years": {}}
+    index_changed = False
+    
+    # 遍历所有年份目录（os.scandir 直接给出文件类型，省去逐个 stat）
+    with os.scandir(archive_dir) as it:
+        year_entries = [entry for entry in it
+                        if entry.name.isdigit() and len(entry.name) == 4 and entry.is_dir()]
     
-    # 遍历所有年份目录
-    for item in os.listdir(archive_dir):
-        item_path = os.path.join(archive_dir, item)
-        if os.path.isdir(item_path) and item.isdigit() and len(item) == 4:
-            year = item
+    for year_entry in year_entries:
+        item_path = year_entry.path
+        year = year_entry.name
+        
+        # 年份目录的 mtime 未变（没有增删文件）时直接复用上次的统计结果
+        dir_mtime = year_entry.stat().st_mtime_ns
+        cached = _STATS_CACHE.get(item_path)
+        if cached is not None and cached[0] == dir_mtime:
+            year_files = list(cached[1])
+        else:
             year_files = []
             
             # 统计该年份的文件
-            for filename in os.listdir(item_path):
-                if filename.startswith('spotify_prices_all_countries_') and filename.endswith('.json'):
-                    filepath = os.path.join(item_path, filename)
-                    mtime = os.path.getmtime(filepath)
-                    year_files.append((filepath, mtime, filename))
+            with os.scandir(item_path) as it:
+                for entry in it:
+                    filename = entry.name
+                    if filename.startswith('spotify_prices_all_countries_') and filename.endswith('.json'):
+                        year_files.append((entry.path, entry.stat().st_mtime, filename))
             
             # 按时间排序
             year_files.sort(key=lambda x: x[1], reverse=True)
-            stats["years"][year] = {
-                "count": len(year_files),
-                "files": year_files
-            }
-            stats["total_files"] += len(year_files)
+            _STATS_CACHE[item_path] = (dir_mtime, tuple(year_files))
+            index_changed = True
+        
+        stats["years"][year] = {
+            "count": len(year_files),
+            "files": year_files
+        }
+        stats["total_files"] += len(year_files)
+    
+    if index_changed:
+        save_archive_index(archive_dir)
     
     return stats
 
+def _normalize_decimal(number: str) -> str:
+    """根据逗号和点的位置判断小数分隔符，返回可直接转换为 float 的字符串"""
+    last_dot = number.rfind('.')
+    last_comma = number.rfind(',')
+    
+    if last_comma > last_dot:
+        if last_dot != -1:
+            # 欧式格式 (1.234,56) - 点是千位分隔符，逗号是小数点
+            return number.replace('.', '').replace(',', '.')
+        if number.find(',') == last_comma and len(number) - last_comma <= 3:
+            # 只有一个逗号且小数部分是1-2位数，很可能是小数点 (例如: 5,99)
+            return number.replace(',', '.')
+        # 小数部分超过2位或多个逗号，都是千位分隔符 (例如: 2,499)
+        return number.replace(',', '')
+    
+    if last_dot > last_comma:
+        if last_comma != -1:
+            # 美式格式 (1,234.56) - 逗号是千位分隔符，点是小数点
+            return number.replace(',', '')
+        if number.find('.') == last_dot and len(number) - last_dot <= 3:
+            # 只有一个点且小数部分是1-2位数，保持为小数点 (例如: 5.99)
+            return number
+        # 小数部分超过2位或多个点，都是千位分隔符 (例如: 2.499)
+        return number.replace('.', '')
+    
+    # 没有分隔符
+    return number
+
+@lru_cache(maxsize=4096)
 def extract_price_number(price_str: str) -> float:
     """从价格字符串中提取数值"""
     if not price_str:
         return 0.0
     
     # 首先尝试提取货币符号后面的数字部分
-    # 匹配货币符号(如USD, $, €等)后跟数字的模式
-    currency_pattern = r'([$]|US[$]|CA[$]|A[$]|S[$]|HK[$]|MX[$]|NZ[$]|NT[$]|R[$]|C[$]|USD|EUR|GBP|CAD|AUD|SGD|HKD|MXN|BRL|JPY|CNY|KRW|INR|THB|MYR|IDR|PHP|VND|TWD|CHF|SEK|NOK|DKK|PLN|CZK|HUF|RON|BGN|HRK|RSD|BAM|MKD|ALL|MDL|UAH|BYN|RUB|GEL|AMD|AZN|KGS|KZT|UZS|TJS|TMT|AFN|PKR|LKR|BDT|BTN|NPR|MVR|IRR|IQD|JOD|KWD|BHD|QAR|SAR|AED|OMR|YER|EGP|LBP|SYP|TND|DZD|MAD|LYD|SDG|SOS|ETB|ERN|DJF|KMF|SCR|MUR|MGA|MWK|ZMW|BWP|SZL|LSL|ZAR|NAD|AOA|XAF|XOF|XPF|NZD|FJD|TOP|WST|VUV|SBD|PGK|NCF|TVD|KID|MHD|PWD|FMD|GHS|NGN|LRD|SLL|GMD|GNF|CIV|BFA|MLI|NER|TCD|CMR|GAB|GNQ|COG|CAF|TZS|KES|UGX|RWF|BIF|MZN|ZWL|€|£|¥|￥|₹|₱|₪|₨|₦|₵|₡|₩|₴|₽|₺|zł|Kč|Ft|kr)\s+([\d,\.]+)'
-    
-    currency_match = re.search(currency_pattern, price_str, re.IGNORECASE)
+    currency_match = _CURRENCY_RE.search(price_str)
     if currency_match:
         number_part = currency_match.group(2)
     else:
         # 如果没找到货币符号，尝试提取纯数字部分
         # 查找数字、逗号、点的连续组合
-        number_pattern = r'([\d,\.]+)'
-        number_matches = re.findall(number_pattern, price_str)
+        number_matches = _NUMBER_RE.findall(price_str)
         
         if number_matches:
             # 找到最长的数字串（通常是价格）
@@ -131,93 +246,58 @@ def extract_price_number(price_str: str) -> float:
             return 0.0
 
     # 如果没有数字，返回0                                                                              
-    if not re.search(r'\d', number_part):                                                                  
+    if not _DIGIT_RE.search(number_part):                                                                  
         return 0.0 
     
     # 处理不同的数字格式
-    cleaned = number_part
-    if ',' in cleaned and '.' in cleaned:
-        # 判断是欧式格式还是美式格式
-        comma_pos = cleaned.rindex(',')
-        dot_pos = cleaned.rindex('.')
-        if comma_pos > dot_pos:
-            # 欧式格式 (1.234,56) - 点是千位分隔符，逗号是小数点
-            cleaned = cleaned.replace('.', '').replace(',', '.')
-        else:
-            # 美式格式 (1,234.56) - 逗号是千位分隔符，点是小数点
-            cleaned = cleaned.replace(',', '')
-    elif ',' in cleaned:
-        # 只有逗号的情况
-        parts = cleaned.split(',')
-        if len(parts) == 2:
-            # 检查小数部分长度来判断是小数点还是千位分隔符
-            decimal_part = parts[-1]
-            if len(decimal_part) <= 2:
-                # 小数部分是1-2位数，很可能是小数点 (例如: 5,99)
-                cleaned = cleaned.replace(',', '.')
-            else:
-                # 小数部分超过2位，很可能是千位分隔符 (例如: 2,499)
-                cleaned = cleaned.replace(',', '')
-        else:
-            # 多个逗号，都是千位分隔符
-            cleaned = cleaned.replace(',', '')
-    elif '.' in cleaned:
-        # 只有点的情况
-        parts = cleaned.split('.')
-        if len(parts) == 2:
-            # 检查小数部分长度
-            decimal_part = parts[-1]
-            if len(decimal_part) <= 2:
-                # 小数部分是1-2位数，保持为小数点 (例如: 5.99)
-                pass  # 保持不变
-            else:
-                # 小数部分超过2位，很可能是千位分隔符 (例如: 2.499)
-                cleaned = cleaned.replace('.', '')
-        else:
-            # 多个点，都是千位分隔符
-            cleaned = cleaned.replace('.', '')
+    cleaned = _normalize_decimal(number_part)
     
     try:
         return float(cleaned)
     except ValueError:
         return 0.0
 
+# 货币符号到货币代码的映射（映射表未覆盖国家时的回退检测）
+CURRENCY_SYMBOLS = {
+    # 优先检查带前缀的美元符号
+    'US$': 'USD', 'USD': 'USD',
+    # 其他特殊美元符号
+    'C$': 'CAD', 'CA$': 'CAD', 'A$': 'AUD', 'S$': 'SGD', 'HK$': 'HKD',
+    'MX$': 'MXN', 'NZ$': 'NZD', 'NT$': 'TWD',
+    # 其他货币符号
+    'R$': 'BRL', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '￥': 'JPY',
+    '₹': 'INR', '₱': 'PHP', '₪': 'ILS', '₨': 'PKR',
+    '₦': 'NGN', '₵': 'GHS', '₡': 'CRC',
+    '₩': 'KRW', '₴': 'UAH', '₽': 'RUB',
+    '₺': 'TRY', 'zł': 'PLN', 'Kč': 'CZK', 'Ft': 'HUF',
+    'CHF': 'CHF', 'NOK': 'NOK', 'SEK': 'SEK', 'DKK': 'DKK',
+    'SGD': 'SGD', 'MYR': 'MYR', 'THB': 'THB', 'IDR': 'IDR', 
+    'PKR': 'PKR', 'LKR': 'LKR', 'BDT': 'BDT', 'NGN': 'NGN', 
+    'GHS': 'GHS', 'KES': 'KES', 'TZS': 'TZS', 'UGX': 'UGX', 
+    'ZAR': 'ZAR', 'EGP': 'EGP', 'SAR': 'SAR', 'AED': 'AED', 
+    'QAR': 'QAR', 'IQD': 'IQD', 'COP': 'COP', 'TRY': 'TRY', 
+    'RON': 'RON', 'BGN': 'BGN', 'kr': 'SEK',
+    # 最后检查通用美元符号
+    '$': 'USD'
+}
+
+# 模块加载时按符号长度从长到短排好序，避免每次调用都重新排序
+_SORTED_SYMBOLS = tuple(sorted(CURRENCY_SYMBOLS.items(), key=lambda x: len(x[0]), reverse=True))
+# 末尾映射到默认货币 USD 的符号（通用 '$'）命中与否结果相同，无需扫描
+while _SORTED_SYMBOLS and _SORTED_SYMBOLS[-1][1] == 'USD':
+    _SORTED_SYMBOLS = _SORTED_SYMBOLS[:-1]
+
+@lru_cache(maxsize=4096)
 def detect_currency(price_str: str, country_code: str = None) -> str:
     """检测价格字符串中的货币"""
 
-    # 1. 优先使用静态映射表
-    if country_code and country_code in SPOTIFY_REAL_CURRENCY_MAP:
-        expected_currency = SPOTIFY_REAL_CURRENCY_MAP[country_code]["currency"]
-        print(f"    💱 {country_code}: 使用映射表货币 {expected_currency}")
+    # 1. 优先使用静态映射表（调用方随后会打印检测到的货币，这里不再重复输出）
+    expected_currency = _CC_TO_CURRENCY.get(country_code)
+    if expected_currency is not None:
         return expected_currency
     
-    currency_symbols = {
-        # 优先检查带前缀的美元符号
-        'US$': 'USD', 'USD': 'USD',
-        # 其他特殊美元符号
-        'C$': 'CAD', 'CA$': 'CAD', 'A$': 'AUD', 'S$': 'SGD', 'HK$': 'HKD',
-        'MX$': 'MXN', 'NZ$': 'NZD', 'NT$': 'TWD',
-        # 其他货币符号
-        'R$': 'BRL', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '￥': 'JPY',
-        '₹': 'INR', '₱': 'PHP', '₪': 'ILS', '₨': 'PKR',
-        '₦': 'NGN', '₵': 'GHS', '₡': 'CRC',
-        '₩': 'KRW', '₴': 'UAH', '₽': 'RUB',
-        '₺': 'TRY', 'zł': 'PLN', 'Kč': 'CZK', 'Ft': 'HUF',
-        'CHF': 'CHF', 'NOK': 'NOK', 'SEK': 'SEK', 'DKK': 'DKK',
-        'SGD': 'SGD', 'MYR': 'MYR', 'THB': 'THB', 'IDR': 'IDR', 
-        'PKR': 'PKR', 'LKR': 'LKR', 'BDT': 'BDT', 'NGN': 'NGN', 
-        'GHS': 'GHS', 'KES': 'KES', 'TZS': 'TZS', 'UGX': 'UGX', 
-        'ZAR': 'ZAR', 'EGP': 'EGP', 'SAR': 'SAR', 'AED': 'AED', 
-        'QAR': 'QAR', 'IQD': 'IQD', 'COP': 'COP', 'TRY': 'TRY', 
-        'RON': 'RON', 'BGN': 'BGN', 'kr': 'SEK',
-        # 最后检查通用美元符号
-        '$': 'USD'
-    }
-    
-    # 按符号长度从长到短排序，优先匹配更具体的符号
-    sorted_symbols = sorted(currency_symbols.items(), key=lambda x: len(x[0]), reverse=True)
-    
-    for symbol, currency in sorted_symbols:
+    # 按符号长度从长到短依次匹配，优先匹配更具体的符号
+    for symbol, currency in _SORTED_SYMBOLS:
         if symbol in price_str:
             return currency
     
@@ -388,6 +468,9 @@ SPOTIFY_REAL_CURRENCY_MAP = {
     "ZW": {"currency": "USD", "symbol": "US$"},  # Zimbabwe
 }
 
+# 国家代码 -> 货币代码 的扁平映射，detect_currency 热路径只需一次字典查找
+_CC_TO_CURRENCY = {code: info["currency"] for code, info in SPOTIFY_REAL_CURRENCY_MAP.items()}
+
 # 完整的国家代码列表（按大洲分组）
 COUNTRY_CODES = {
     # Africa
@@ -444,17 +527,53 @@ COUNTRY_CODES = {
     "TV": "Tuvalu", "VU": "Vanuatu"
 }
 
+# 定位 <script id="__NEXT_DATA__" type="application/json"> 的内容（属性顺序不限）
+_NEXT_DATA_RE = re.compile(
+    r'<script(?=[^>]*\sid=["\']?__NEXT_DATA__["\'\s/>])(?=[^>]*\stype=["\']?application/json["\'\s/>])[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# HTML 回退解析用到的正则，模块加载时编译一次
+_CLASS_PLAN_RE = re.compile(r'plan|price|subscription|premium|family', re.I)
+_CLASS_PRICE_RE = re.compile(r'price|cost|amount', re.I)
+_PRICE_VALIDATE_RE = re.compile(r'[€$£¥₹₱₪₨₦₵₡]\s*[\d,.]|\d+[\d,.]*\s*[€$£¥₹₱₪₨₦₵₡]')
+_CURRENCY_SYMBOL_RE = re.compile(r'[€$£¥₹₱₪₨₦₵₡]')
+_PRICE_CHAR_RE = re.compile(r'[€$£¥₹₱₪₨₦₵₡0-9]')
+# 页面是否包含价格相关关键词（忽略大小写直接搜索，无需复制整页的小写副本）
+_PAGE_KEYWORDS_RE = re.compile(r'premium|family|price|subscription', re.IGNORECASE)
+# 异常的零价格（如 $0. 等）
+_ZERO_PRICE_RE = re.compile(r'[€$£¥₹₱₪₨₦₵₡]*\s*0[\.,]?\s*[€$£¥₹₱₪₨₦₵₡]*$')
+
+# 更全面的正则模式，匹配所有套餐类型
+_PLAN_PATTERNS = [re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in (
+    r'(Premium\s+(?:Family|Individual|Student|Duo)|(?:Family|Individual|Student|Duo)\s+Premium|Premium)\s*[:\-]?\s*([€$£¥₹₱₪₨₦₵₡]\s*[\d,.]+|[\d,.]+\s*[€$£¥₹₱₪₨₦₵₡])',
+    r'(Premium\s+(?:Family|Individual|Student|Duo)|(?:Family|Individual|Student|Duo)).*?([€$£¥₹₱₪₨₦₵₡]\s*[\d,.][\d,.\s]*)',
+    r'([€$£¥₹₱₪₨₦₵₡]\s*[\d,.][\d,.\s]*)\s*.*?(Premium\s+(?:Family|Individual|Student|Duo)|(?:Family|Individual|Student|Duo))',
+    r'([€$£¥₹₱₪₨₦₵₡]\s*[\d,.][\d,.\s]*)\s*/?\s*month',
+)]
+
+_CONTAINER_TAGS = frozenset(('div', 'section', 'article'))
+
+def _has_plan_class(tag: Tag) -> bool:
+    """判断元素的 class 是否包含套餐/价格相关关键词"""
+    classes = tag.get('class')
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        return _CLASS_PLAN_RE.search(classes) is not None
+    return any(_CLASS_PLAN_RE.search(cls) for cls in classes)
+
 def extract_spotify_prices(html: str) -> List[Dict[str, Any]]:
     """从 Spotify 页面 HTML 中提取价格信息，参考 spotify.py 的结构化解析"""
-    soup = BeautifulSoup(html, 'html.parser')
     plans = []
     
     try:
         # 首先尝试从 __NEXT_DATA__ 脚本中提取结构化数据（类似 spotify.py）
-        json_script = soup.find('script', {'id': '__NEXT_DATA__', 'type': 'application/json'})
+        # 直接在原始 HTML 上用正则定位脚本内容，结构化数据可用时无需构建整棵 DOM 树
+        json_script = _NEXT_DATA_RE.search(html)
         if json_script:
             try:
-                data = json.loads(json_script.get_text())
+                data = orjson.loads(json_script.group(1))
                 # 尝试从结构化数据中提取套餐信息
                 structured_plans = (data.get('props', {})
                                   .get('pageProps', {})
@@ -463,7 +582,7 @@ def extract_spotify_prices(html: str) -> List[Dict[str, Any]]:
                                   .get('plans', []))
                 
                 if structured_plans:
-                    print(f"    📊 找到结构化数据中的 {len(structured_plans)} 个套餐")
+                    logger.info("    📊 找到结构化数据中的 %s 个套餐", len(structured_plans))
                     for plan in structured_plans:
                         plan_header = (plan.get('header') or "未知套餐").strip()
                         primary_price = (plan.get('primaryPriceDescription') or "").strip()
@@ -485,21 +604,31 @@ def extract_spotify_prices(html: str) -> List[Dict[str, Any]]:
                             plan_data['price'] = primary_price
                             
                         plans.append(plan_data)
-                        print(f"    ✓ 提取套餐: {plan_header} - {plan_data['price']}")
+                        logger.debug("    ✓ 提取套餐: %s - %s", plan_header, plan_data['price'])
                     
                     if plans:
                         return plans
                         
-            except json.JSONDecodeError as e:
-                print(f"    ⚠️ JSON 解析失败: {e}")
+            except orjson.JSONDecodeError as e:
+                logger.warning("    ⚠️ JSON 解析失败: %s", e)
             except Exception as e:
-                print(f"    ⚠️ 结构化数据提取失败: {e}")
+                logger.warning("    ⚠️ 结构化数据提取失败: %s", e)
         
         # 如果结构化数据失败，回退到 HTML 解析（参考 disney.py 的表格解析方式）
-        print("    🔄 回退到 HTML 解析模式")
+        logger.info("    🔄 回退到 HTML 解析模式")
+        soup = BeautifulSoup(html, HTML_PARSER)
+        
+        # 只遍历一次 DOM，同时收集价格表格和价格卡片/容器候选
+        price_tables = []
+        price_containers = []
+        for tag in soup.descendants:
+            if isinstance(tag, Tag):
+                if tag.name == 'table':
+                    price_tables.append(tag)
+                elif tag.name in _CONTAINER_TAGS and _has_plan_class(tag):
+                    price_containers.append(tag)
         
         # 1. 查找价格表格
-        price_tables = soup.find_all('table')
         for table in price_tables:
             try:
                 if isinstance(table, Tag):  # 确保是 Tag 对象
@@ -511,36 +640,32 @@ def extract_spotify_prices(html: str) -> List[Dict[str, Any]]:
                                 plan_text = cols[0].get_text(strip=True)
                                 price_text = ' '.join(cols[-1].get_text(separator=' ', strip=True).split())
                                 
-                                if any(c in price_text for c in '€$£¥₹₱₪₨₦₵₡0123456789'):
+                                if _PRICE_CHAR_RE.search(price_text):
                                     plans.append({
                                         'plan': plan_text,
                                         'price': price_text,
                                         'source': 'table_parsing'
                                     })
-                                    print(f"    ✓ 表格提取套餐: {plan_text} - {price_text}")
+                                    logger.debug("    ✓ 表格提取套餐: %s - %s", plan_text, price_text)
             except Exception as e:
-                print(f"    ⚠️ 表格解析错误: {e}")
+                logger.warning("    ⚠️ 表格解析错误: %s", e)
                 continue
         
         # 2. 查找价格卡片/容器（更精确的选择器）
         if not plans:
-            price_containers = soup.find_all(['div', 'section', 'article'], 
-                                           class_=re.compile(r'plan|price|subscription|premium|family', re.I))
-            
             for container in price_containers:
                 if isinstance(container, Tag):  # 确保是 Tag 对象
                     container_text = container.get_text(' ', strip=True).lower()
                     
                     # 在此容器内查找价格信息
-                    price_elements = container.find_all(['span', 'div', 'p'], 
-                                                      class_=re.compile(r'price|cost|amount', re.I))
+                    price_elements = container.find_all(['span', 'div', 'p'], class_=_CLASS_PRICE_RE)
                     
                     for price_elem in price_elements:
                         if isinstance(price_elem, Tag):  # 确保是 Tag 对象
                             price_text = price_elem.get_text(strip=True)
                             
                             # 验证是否包含价格信息
-                            if re.search(r'[€$£¥₹₱₪₨₦₵₡]\s*[\d,.]|\d+[\d,.]*\s*[€$£¥₹₱₪₨₦₵₡]', price_text):
+                            if _PRICE_VALIDATE_RE.search(price_text):
                                 # 尝试从附近找到套餐名称
                                 plan_name = "Premium Plan"
                                 
@@ -558,28 +683,20 @@ def extract_spotify_prices(html: str) -> List[Dict[str, Any]]:
                                     'price': price_text,
                                     'source': 'container_parsing'
                                 })
-                                print(f"    ✓ 容器提取套餐: {plan_name} - {price_text}")
+                                logger.debug("    ✓ 容器提取套餐: %s - %s", plan_name, price_text)
         
         # 3. 最后的正则表达式匹配（更精确的模式）
         if not plans:
             all_text = soup.get_text()
             
-            # 更全面的正则模式，匹配所有套餐类型
-            plan_patterns = [
-                r'(Premium\s+(?:Family|Individual|Student|Duo)|(?:Family|Individual|Student|Duo)\s+Premium|Premium)\s*[:\-]?\s*([€$£¥₹₱₪₨₦₵₡]\s*[\d,.]+|[\d,.]+\s*[€$£¥₹₱₪₨₦₵₡])',
-                r'(Premium\s+(?:Family|Individual|Student|Duo)|(?:Family|Individual|Student|Duo)).*?([€$£¥₹₱₪₨₦₵₡]\s*[\d,.][\d,.\s]*)',
-                r'([€$£¥₹₱₪₨₦₵₡]\s*[\d,.][\d,.\s]*)\s*.*?(Premium\s+(?:Family|Individual|Student|Duo)|(?:Family|Individual|Student|Duo))',
-                r'([€$£¥₹₱₪₨₦₵₡]\s*[\d,.][\d,.\s]*)\s*/?\s*month'
-            ]
-            
-            for pattern in plan_patterns:
-                matches = re.findall(pattern, all_text, re.IGNORECASE | re.MULTILINE)
+            for pattern in _PLAN_PATTERNS:
+                matches = pattern.findall(all_text)
                 for match in matches:
                     if isinstance(match, tuple):
                         if len(match) == 2:
                             # 判断哪个是套餐名，哪个是价格
                             first, second = match
-                            if re.search(r'[€$£¥₹₱₪₨₦₵₡]', first):
+                            if _CURRENCY_SYMBOL_RE.search(first):
                                 # 第一个是价格，第二个是套餐名
                                 plan_name, price = second, first
                             else:
@@ -604,158 +721,481 @@ def extract_spotify_prices(html: str) -> List[Dict[str, Any]]:
                             'source': 'regex_parsing'
                         })
                     
-                    print(f"    ✓ 正则提取套餐: {plans[-1]['plan']} - {plans[-1]['price']}")
+                    logger.debug("    ✓ 正则提取套餐: %s - %s", plans[-1]['plan'], plans[-1]['price'])
                     
                 if plans:  # 找到就停止
                     break
         
-        # 去重和清理
-        seen_prices = set()
-        clean_plans = []
+        # 去重和清理：只校验每个 (套餐, 价格) 首次出现的条目，重复条目一次字典查找即跳过
+        unique_plans = {}
         for plan in plans:
             price_key = (plan['plan'], plan['price'])
-            if price_key not in seen_prices:
-                # 清理异常价格（如 $0. 等）
-                price = plan['price'].strip()
-                if re.search(r'[\d]', price) and not re.match(r'[€$£¥₹₱₪₨₦₵₡]*\s*0[\.,]?\s*[€$£¥₹₱₪₨₦₵₡]*$', price):
-                    seen_prices.add(price_key)
-                    clean_plans.append(plan)
-        
-        print(f"    📊 清理后获得 {len(clean_plans)} 个有效套餐")
+            if price_key in unique_plans:
+                continue
+            # 清理异常价格（如 $0. 等）；校验结果只取决于价格，无效条目记为 None 避免重复校验
+            price = plan['price'].strip()
+            unique_plans[price_key] = plan if _DIGIT_RE.search(price) and not _ZERO_PRICE_RE.match(price) else None
+        clean_plans = [plan for plan in unique_plans.values() if plan is not None]
+        
+        logger.info("    📊 清理后获得 %s 个有效套餐", len(clean_plans))
         return clean_plans
         
     except Exception as e:
-        print(f"    ❌ 解析价格时出错: {e}")
+        logger.warning("    ❌ 解析价格时出错: %s", e)
         return []
 
-async def get_spotify_prices_for_country(browser: Browser, country_code: str, country_name: str, max_retries: int = 2) -> Optional[Dict[str, Any]]:
+# 页面 HTML 缓存目录及有效期
+HTML_CACHE_DIR = os.path.join('archive', 'html_cache')
+HTML_CACHE_TTL = 24 * 60 * 60  # 一天
+
+# 运行状态目录（静态抓取探测结果、各国 storageState），不纳入版本管理
+STATE_DIR = os.path.join('archive', 'state')
+# 每个国家 storageState（只保存 Cookie）的有效期：定时任务每周运行一次，略长于一周才能在下次运行时复用
+STORAGE_STATE_TTL = 8 * 24 * 60 * 60
+
+def get_storage_state_path(country_code: str) -> Optional[str]:
+    """返回未过期的 storageState 文件路径，不存在或已超过有效期时返回 None"""
+    state_path = os.path.join(STATE_DIR, f"{country_code}.json")
+    try:
+        mtime = os.stat(state_path).st_mtime
+    except FileNotFoundError:
+        return None
+    if time.time() - mtime > STORAGE_STATE_TTL:
+        return None
+    return state_path
+
+async def save_storage_state(context: BrowserContext, country_code: str):
+    """保存国家对应的 Cookie 为 storageState，失败时不影响价格抓取"""
+    try:
+        # 池中的上下文每次放回前都会清空 Cookie，此时的 Cookie 只属于本国；
+        # localStorage 不会被清空，可能带有其他国家的数据，因此不保存
+        state = {'cookies': await context.cookies(), 'origins': []}
+        os.makedirs(STATE_DIR, exist_ok=True)
+        atomic_write(os.path.join(STATE_DIR, f"{country_code}.json"), orjson.dumps(state))
+    except Exception as e:
+        logger.warning("    ⚠️ %s: 保存 storageState 失败: %s", country_code, e)
+
+# 解析价格用不到的资源类型和第三方统计脚本，页面加载时直接拦截
+BLOCKED_RESOURCE_TYPES = frozenset(('image', 'font', 'media', 'stylesheet'))
+BLOCKED_URL_KEYWORDS = ('googletagmanager', 'google-analytics', 'doubleclick', 'segment.io', 'branch.io')
+
+async def block_heavy_resources(route):
+    """拦截图片、字体、媒体、样式表及统计脚本请求，其余请求正常放行"""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(keyword in request.url for keyword in BLOCKED_URL_KEYWORDS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+# 抓取使用的请求头，在创建上下文时统一设置
+SCRAPE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+}
+
+async def new_scrape_context(browser: Browser, storage_state: Optional[str] = None) -> BrowserContext:
+    """创建抓取用的 BrowserContext：设置请求头并拦截无关资源，可选载入 storageState"""
+    if storage_state:
+        context = await browser.new_context(extra_http_headers=SCRAPE_HEADERS, storage_state=storage_state)
+    else:
+        context = await browser.new_context(extra_http_headers=SCRAPE_HEADERS)
+    await context.route("**/*", block_heavy_resources)
+    return context
+
+class AdaptiveSemaphore:
+    """并发上限随请求结果自动调整的信号量：遇到 429 减少一个许可，连续成功后增加一个许可"""
+    
+    def __init__(self, permits: int, min_permits: int = 1, max_permits: int = 10, grow_after: int = 10):
+        self._min_permits = min_permits
+        self._max_permits = max_permits
+        self._permits = max(min_permits, min(max_permits, permits))
+        self._grow_after = grow_after
+        self._in_use = 0
+        self._success_streak = 0
+        self._rate_limited_count = 0
+        self._waiters = deque()
+    
+    @property
+    def permits(self) -> int:
+        return self._permits
+    
+    @property
+    def rate_limited_count(self) -> int:
+        return self._rate_limited_count
+    
+    async def __aenter__(self):
+        if self._in_use < self._permits and not self._waiters:
+            self._in_use += 1
+            return self
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter  # 唤醒时许可已经转交给当前协程
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self._release()
+    
+    def _release(self):
+        self._in_use -= 1
+        self._wake()
+    
+    def _wake(self):
+        """在许可范围内依次唤醒等待者"""
+        while self._waiters and self._in_use < self._permits:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_use += 1
+                waiter.set_result(None)
+    
+    def on_rate_limited(self):
+        """遇到 429：清空成功计数并减少一个许可，正在执行的任务不受影响"""
+        self._rate_limited_count += 1
+        self._success_streak = 0
+        if self._permits > self._min_permits:
+            self._permits -= 1
+            logger.info("    🔧 遇到频率限制，并发数降为 %s", self._permits)
+    
+    def on_success(self):
+        """请求成功：连续成功达到阈值时增加一个许可"""
+        self._success_streak += 1
+        if self._success_streak >= self._grow_after and self._permits < self._max_permits:
+            self._success_streak = 0
+            self._permits += 1
+            logger.info("    🔧 连续请求成功，并发数升为 %s", self._permits)
+            self._wake()
+
+# 当前抓取使用的自适应并发限制，由 scrape_all 创建
+_LIMITER: Optional[AdaptiveSemaphore] = None
+
+# 429 退避状态：所有请求都发往 www.spotify.com，共用一份状态
+# 只在事件循环内同步读写（中间没有 await），无需额外加锁
+BACKOFF_MAX_SECONDS = 60
+_BACKOFF = {'until': 0.0, 'attempts': 0}
+
+def register_rate_limit(retry_after: Optional[str]) -> float:
+    """记录一次 429：优先遵循 Retry-After，否则指数退避并加随机抖动，返回等待秒数（不超过 BACKOFF_MAX_SECONDS）"""
+    wait = None
+    if retry_after:
+        try:
+            # 退避状态由所有工作协程共用，过大的 Retry-After 也只等待上限时间，避免整个抓取长时间停顿
+            wait = min(BACKOFF_MAX_SECONDS, max(0.0, float(retry_after)))
+        except ValueError:
+            wait = None  # HTTP 日期格式的 Retry-After 按指数退避处理
+    if wait is None:
+        wait = min(BACKOFF_MAX_SECONDS, 2 ** _BACKOFF['attempts']) + random.uniform(0, 1)
+    _BACKOFF['attempts'] += 1
+    _BACKOFF['until'] = max(_BACKOFF['until'], time.monotonic() + wait)
+    if _LIMITER is not None:
+        _LIMITER.on_rate_limited()
+    return wait
+
+def register_success():
+    """请求成功后逐步降低退避等级"""
+    if _BACKOFF['attempts'] > 0:
+        _BACKOFF['attempts'] -= 1
+    if _LIMITER is not None:
+        _LIMITER.on_success()
+
+async def wait_for_backoff():
+    """如果仍处于退避期，等待到退避结束再发起请求"""
+    delay = _BACKOFF['until'] - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+def html_cache_get(country_code: str) -> Optional[Tuple[str, str, float]]:
+    """读取未过期的页面缓存，返回 (HTML, 来源 URL, 抓取时间)，不存在或已过期时返回 None"""
+    meta_path = os.path.join(HTML_CACHE_DIR, f"{country_code}.meta.json")
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        fetched_at = meta['fetched_at']
+        if time.time() - fetched_at > HTML_CACHE_TTL:
+            return None
+        with gzip.open(os.path.join(HTML_CACHE_DIR, f"{country_code}.html.gz"), 'rt', encoding='utf-8') as f:
+            return f.read(), meta['url'], fetched_at
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def html_cache_put(country_code: str, url: str, html: str):
+    """以 gzip 压缩保存页面 HTML，并在旁路 meta 文件中记录来源 URL 和抓取时间"""
+    try:
+        os.makedirs(HTML_CACHE_DIR, exist_ok=True)
+        # 两个文件都原子写入，中断时不会留下截断的文件；meta 最后写入，读取时 HTML 文件已经完整
+        atomic_write(os.path.join(HTML_CACHE_DIR, f"{country_code}.html.gz"), gzip.compress(html.encode('utf-8')))
+        atomic_write(os.path.join(HTML_CACHE_DIR, f"{country_code}.meta.json"),
+                     json.dumps({'url': url, 'fetched_at': time.time()}))
+    except OSError as e:
+        logger.warning("    ⚠️ %s: 写入页面缓存失败: %s", country_code, e)
+
+def build_country_data(country_code: str, country_name: str, plans: List[Dict[str, Any]], source_url: str,
+                       attempt: int, scraped_at: Optional[float] = None) -> Dict[str, Any]:
+    """为每个套餐补充价格数值和货币，组装国家结果"""
+    if scraped_at is None:
+        scraped_at = time.time()
+    
+    # 同一国家的套餐使用同一种货币，静态映射表只需查询一次
+    country_currency = _CC_TO_CURRENCY.get(country_code)
+    
+    # 为每个套餐添加基本信息
+    enhanced_plans = []
+    for plan in plans:
+        enhanced_plan = plan.copy()
+        
+        # 提取价格数值和货币
+        price_str = plan.get('price', '')
+        if price_str:
+            price_number = extract_price_number(price_str)
+            detected_currency = country_currency or detect_currency(price_str, country_code)
+            
+            enhanced_plan['price_number'] = price_number
+            enhanced_plan['currency'] = detected_currency
+            
+            # 显示检测到的货币信息
+            logger.debug("    💰 %s: %s (%s)", plan.get('plan', 'Unknown'), price_str, detected_currency)
+        
+        enhanced_plans.append(enhanced_plan)
+    
+    return {
+        'country_code': country_code,
+        'country_name': country_name,
+        'plans': enhanced_plans,
+        # 使用缓存时记录页面实际抓取的时间
+        'scraped_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(scraped_at)),
+        'source_url': source_url,
+        'attempt': attempt
+    }
+
+def premium_urls(country_code: str) -> List[str]:
+    """按优先顺序返回国家的 Premium 页面地址：英文版优先，本地版备用"""
+    return [
+        f"https://www.spotify.com/{country_code.lower()}-en/premium",
+        f"https://www.spotify.com/{country_code.lower()}/premium",
+    ]
+
+# 静态抓取探测结果：True 表示直接请求 HTML 即可解析出价格，False 表示需要浏览器渲染
+STATIC_PROBE_FILE = os.path.join(STATE_DIR, 'static_countries.json')
+_STATIC_PROBE: Dict[str, bool] = {}
+
+def load_static_probe():
+    """载入上次运行保存的静态抓取探测结果"""
+    try:
+        with open(STATIC_PROBE_FILE, 'r', encoding='utf-8') as f:
+            _STATIC_PROBE.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+def save_static_probe():
+    """保存静态抓取探测结果，供之后的运行直接选择抓取方式"""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        atomic_write(STATIC_PROBE_FILE, orjson.dumps(_STATIC_PROBE, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    except OSError as e:
+        logger.warning("⚠️ 保存静态抓取探测结果失败: %s", e)
+
+# 静态请求共用一个 Session，各国家的请求复用到 www.spotify.com 的连接
+STATIC_SESSION = requests.Session()
+STATIC_SESSION.headers.update(SCRAPE_HEADERS)
+
+def _fetch_static_html(url: str) -> Tuple[int, str, Optional[str]]:
+    """同步请求页面 HTML（跟随地区跳转），返回 (状态码, 页面内容, Retry-After)"""
+    response = STATIC_SESSION.get(url, timeout=10)
+    return response.status_code, response.text, response.headers.get('retry-after')
+
+async def fetch_static(country_code: str, url: str) -> Tuple[str, str, List[Dict[str, Any]]]:
+    """不经过浏览器直接请求页面并解析，返回 (结果, 页面内容, 解析出的套餐)，结果为 'ok'、'needs_js' 或 'failed'"""
+    await wait_for_backoff()
+    try:
+        status, page_content, retry_after = await asyncio.to_thread(_fetch_static_html, url)
+    except requests.RequestException as e:
+        logger.info("    ⚡ %s: 静态请求 %s 失败: %s", country_code, url, e)
+        return 'failed', "", []
+    
+    if status == 429:
+        register_rate_limit(retry_after)
+        return 'failed', "", []
+    # 跳转后仍不是正常页面，或页面正常返回但没有可解析的价格，都交给浏览器处理
+    if status != 200:
+        return 'needs_js', "", []
+    
+    plans = extract_spotify_prices(page_content) if _PAGE_KEYWORDS_RE.search(page_content) else []
+    if not plans:
+        return 'needs_js', "", []
+    
+    register_success()
+    logger.info("    ⚡ %s: 静态请求成功解析到 %s 个套餐", country_code, len(plans))
+    return 'ok', page_content, plans
+
+async def try_spotify_url(context: BrowserContext, country_code: str, url: str) -> Tuple[str, str, List[Dict[str, Any]]]:
+    """在新页面中加载单个 URL，返回 (结果, 页面内容, 解析出的套餐)，结果为 'ok'、'rate_limited' 或 'failed'"""
+    page = None
+    try:
+        page = await context.new_page()
+        logger.info("    🔗 %s: %s", country_code, url)
+        
+        # 其他任务刚遇到 429 时，先等退避结束
+        await wait_for_backoff()
+        
+        # 导航到页面 - 并发优化：缩短超时时间
+        response = await page.goto(url, wait_until='domcontentloaded', timeout=15000)
+        
+        # 检查状态码
+        if not response:
+            logger.warning("    ❌ %s: 无响应，尝试下一个URL", country_code)
+            return 'failed', "", []
+        
+        status = response.status
+        logger.info("    📊 %s: 状态码 %s", country_code, status)
+        
+        # 如果是重定向或404，尝试下一个URL
+        if status in [302, 404]:
+            logger.info("    ↻ %s: %s 响应，尝试下一个URL", country_code, status)
+            return 'failed', "", []
+        elif status == 429:
+            wait = register_rate_limit(response.headers.get('retry-after'))
+            logger.warning("    ⚠️  %s: 频率限制 (429)，%.1f 秒后重试", country_code, wait)
+            return 'rate_limited', "", []
+        elif status != 200:
+            # 其他状态码也尝试下一个URL
+            logger.info("    ↻ %s: 状态码 %s，尝试下一个URL", country_code, status)
+            return 'failed', "", []
+        
+        # 并发优化：随机等待片刻，让其他任务有机会执行，同时错开对 Spotify 的请求节奏
+        await page.wait_for_timeout(random.randint(1000, 2000))
+        
+        # 尝试等待价格元素加载 - 减少超时时间
+        try:
+            await page.wait_for_selector('[class*="price"], [class*="plan"], [class*="subscription"]', 
+                                       timeout=5000)
+        except Exception:
+            pass  # 如果找不到这些选择器也继续
+        
+        page_content = await page.content()
+        
+        # 检查页面是否包含价格信息
+        if not _PAGE_KEYWORDS_RE.search(page_content):
+            logger.info("    ↻ %s: 页面无价格信息，尝试下一个URL", country_code)
+            return 'failed', "", []
+        
+        logger.info("    ✓ %s: 找到价格信息，开始解析...", country_code)
+        
+        # 立即尝试解析价格
+        plans = extract_spotify_prices(page_content)
+        if not plans:
+            logger.info("    ↻ %s: 页面有价格关键词但解析失败，尝试下一个URL", country_code)
+            return 'failed', "", []
+        
+        logger.info("    ✓ %s: 成功解析到 %s 个套餐", country_code, len(plans))
+        register_success()
+        return 'ok', page_content, plans
+    
+    except Exception as e:
+        logger.warning("    ❌ %s: 访问 %s 失败: %s", country_code, url, e)
+        return 'failed', "", []
+    
+    finally:
+        if page:
+            await page.close()
+
+async def get_spotify_prices_for_country(browser: Browser, context_pool: asyncio.Queue, country_code: str, country_name: str, max_retries: int = 2) -> Optional[Dict[str, Any]]:
     """获取指定国家的 Spotify 价格，支持重试机制（并发优化版）"""
     
+    # 有效期内的页面缓存直接解析，跳过浏览器抓取
+    cached = html_cache_get(country_code)
+    if cached:
+        cached_html, cached_url, fetched_at = cached
+        plans = extract_spotify_prices(cached_html)
+        if plans:
+            logger.info("    💾 %s: 使用页面缓存 %s", country_code, cached_url)
+            return build_country_data(country_code, country_name, plans, cached_url, 1, fetched_at)
+    
+    # 尚未探测或已知为静态渲染的国家先直接请求 HTML，成功时无需占用浏览器
+    if _STATIC_PROBE.get(country_code, True):
+        needs_js = False
+        for url in premium_urls(country_code):
+            outcome, page_content, plans = await fetch_static(country_code, url)
+            if outcome == 'ok':
+                _STATIC_PROBE[country_code] = True
+                html_cache_put(country_code, url, page_content)
+                return build_country_data(country_code, country_name, plans, url, 1)
+            if outcome == 'needs_js':
+                needs_js = True
+        # 两个地址都无法静态解析时记录下来，之后的运行直接使用浏览器；
+        # 只有网络错误或频率限制时不记录，下次运行仍会重新探测
+        if needs_js:
+            _STATIC_PROBE[country_code] = False
+    
     for attempt in range(max_retries):
-        page = None
+        # 有未过期的 storageState 时为本国单独创建带该状态的上下文，用完即关闭，不放回池中；
+        # 否则从池中借用一个 BrowserContext，只为本次尝试新建页面
+        state_path = get_storage_state_path(country_code)
+        context = None if state_path else await context_pool.get()
+        succeeded = False
         try:
-            page = await browser.new_page()
-            
-            # 设置用户代理
-            await page.set_extra_http_headers({
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            })
+            # 独立上下文在这里创建；之前重建失败时池中放回的是 None，借用时也在这里创建
+            if context is None:
+                context = await new_scrape_context(browser, state_path)
             
             # 构建 Spotify URL - 按照要求优先使用 -en 版本
-            urls_to_try = [
-                f"https://www.spotify.com/{country_code.lower()}-en/premium",  # 优先使用英文版
-                f"https://www.spotify.com/{country_code.lower()}/premium",     # 备用本地版
-            ]
+            urls_to_try = premium_urls(country_code)
             
             success = False
             page_content = ""
             successful_url = ""
+            plans = []
+            rate_limited = False
             
-            for url in urls_to_try:
-                try:
-                    print(f"    🔗 {country_code}: {url}")
-                    
-                    # 导航到页面 - 并发优化：缩短超时时间
-                    response = await page.goto(url, wait_until='domcontentloaded', timeout=15000)
-                    
-                    # 检查状态码
-                    if response:
-                        status = response.status
-                        print(f"    📊 {country_code}: 状态码 {status}")
-                        
-                        # 如果是重定向或404，尝试下一个URL
-                        if status in [302, 404]:
-                            print(f"    ↻ {country_code}: {status} 响应，尝试下一个URL")
-                            continue
-                        elif status == 429:
-                            print(f"    ⚠️  {country_code}: 频率限制 (429)")
-                            if attempt < max_retries - 1:
-                                await asyncio.sleep(random.uniform(3, 6))  # 减少等待时间
-                                break  # 跳出URL循环，重试整个国家
-                            else:
-                                return None
-                        elif status == 200:
-                            # 并发优化：减少等待时间，让其他任务有机会执行
-                            await page.wait_for_timeout(random.randint(1000, 2000))
-                            
-                            # 尝试等待价格元素加载 - 减少超时时间
-                            try:
-                                await page.wait_for_selector('[class*="price"], [class*="plan"], [class*="subscription"]', 
-                                                           timeout=5000)
-                            except:
-                                pass  # 如果找不到这些选择器也继续
-                            
-                            page_content = await page.content()
-                            
-                            # 检查页面是否包含价格信息
-                            if any(keyword in page_content.lower() for keyword in ['premium', 'family', 'price', 'subscription']):
-                                print(f"    ✓ {country_code}: 找到价格信息，开始解析...")
-                                
-                                # 立即尝试解析价格
-                                temp_plans = extract_spotify_prices(page_content)
-                                if temp_plans:
-                                    print(f"    ✓ {country_code}: 成功解析到 {len(temp_plans)} 个套餐")
-                                    success = True
-                                    successful_url = url
-                                    break
-                                else:
-                                    print(f"    ↻ {country_code}: 页面有价格关键词但解析失败，尝试下一个URL")
-                                    continue
-                            else:
-                                print(f"    ↻ {country_code}: 页面无价格信息，尝试下一个URL")
-                                continue
-                        else:
-                            # 其他状态码也尝试下一个URL
-                            print(f"    ↻ {country_code}: 状态码 {status}，尝试下一个URL")
-                            continue
-                    else:
-                        print(f"    ❌ {country_code}: 无响应，尝试下一个URL")
-                        continue
-                        
-                except Exception as e:
-                    print(f"    ❌ {country_code}: 访问 {url} 失败: {e}")
-                    continue
+            # 两个 URL 同时在各自的页面中加载，但仍按顺序采用结果：
+            # 英文版成功时取消本地版；英文版失败时本地版通常已经加载完毕，无需再串行等待
+            url_tasks = [asyncio.create_task(try_spotify_url(context, country_code, url)) for url in urls_to_try]
+            try:
+                for url, url_task in zip(urls_to_try, url_tasks):
+                    outcome, content, url_plans = await url_task
+                    if outcome == 'ok':
+                        success = True
+                        page_content = content
+                        successful_url = url
+                        plans = url_plans
+                        break
+                    if outcome == 'rate_limited':
+                        rate_limited = True
+                        break
+            finally:
+                for url_task in url_tasks:
+                    if not url_task.done():
+                        url_task.cancel()
+                await asyncio.gather(*url_tasks, return_exceptions=True)
+            
+            if rate_limited:
+                if attempt < max_retries - 1:
+                    continue  # 重试整个国家，下次请求前会等待退避结束
+                else:
+                    return None
             
             # 解析价格 - 只有在成功找到页面内容时才执行
             if success:
-                plans = extract_spotify_prices(page_content)
-                
                 if plans:
-                    print(f"    🎯 {country_code}: 最终确认获取到 {len(plans)} 个套餐")
+                    logger.info("    🎯 %s: 最终确认获取到 %s 个套餐", country_code, len(plans))
                     
-                    # 为每个套餐添加基本信息
-                    enhanced_plans = []
-                    for plan in plans:
-                        enhanced_plan = plan.copy()
-                        
-                        # 提取价格数值和货币
-                        price_str = plan.get('price', '')
-                        if price_str:
-                            price_number = extract_price_number(price_str)
-                            detected_currency = detect_currency(price_str, country_code)
-                            
-                            enhanced_plan['price_number'] = price_number
-                            enhanced_plan['currency'] = detected_currency
-                            
-                            # 显示检测到的货币信息
-                            print(f"    💰 {plan.get('plan', 'Unknown')}: {price_str} ({detected_currency})")
-                        
-                        enhanced_plans.append(enhanced_plan)
+                    # 首次成功后保存本国的 Cookie，供之后的运行复用
+                    if not state_path:
+                        await save_storage_state(context, country_code)
+                    
+                    succeeded = True
+                    
+                    # 缓存页面 HTML，有效期内重新运行时无需再启动页面抓取
+                    html_cache_put(country_code, successful_url, page_content)
                     
-                    return {
-                        'country_code': country_code,
-                        'country_name': country_name,
-                        'plans': enhanced_plans,
-                        'scraped_at': time.strftime('%Y-%m-%d %H:%M:%S'),
-                        'source_url': successful_url,
-                        'attempt': attempt + 1
-                    }
+                    return build_country_data(country_code, country_name, plans, successful_url, attempt + 1)
                 else:
-                    print(f"    ❌ {country_code}: 最终解析失败，这不应该发生")
+                    logger.warning("    ❌ %s: 最终解析失败，这不应该发生", country_code)
                     if attempt < max_retries - 1:
-                        print(f"    🔄 {country_code}: 重试整个流程")
+                        logger.info("    🔄 %s: 重试整个流程", country_code)
                         await asyncio.sleep(random.uniform(0.5, 1.5))  # 减少重试等待时间
                         continue
                     else:
@@ -763,15 +1203,15 @@ async def get_spotify_prices_for_country(browser: Browser, country_code: str, co
             else:
                 # 没有成功的URL，进入重试逻辑
                 if attempt < max_retries - 1:
-                    print(f"    🔄 {country_code}: 所有URL都失败，重试 (尝试 {attempt + 2}/{max_retries})")
+                    logger.info("    🔄 %s: 所有URL都失败，重试 (尝试 %s/%s)", country_code, attempt + 2, max_retries)
                     await asyncio.sleep(random.uniform(1, 2))  # 减少重试等待时间
                     continue
                 else:
-                    print(f"    ⏹️ {country_code}: 达到最大重试次数，放弃")
+                    logger.info("    ⏹️ %s: 达到最大重试次数，放弃", country_code)
                     return None
                 
         except Exception as e:
-            print(f"    ❌ {country_code}: 获取失败 - {e}")
+            logger.warning("    ❌ %s: 获取失败 - %s", country_code, e)
             if attempt < max_retries - 1:
                 await asyncio.sleep(random.uniform(1, 2))  # 减少重试等待时间
                 continue
@@ -779,21 +1219,123 @@ async def get_spotify_prices_for_country(browser: Browser, country_code: str, co
                 return None
             
         finally:
-            if page:
-                await page.close()
+            if state_path:
+                # 独立上下文只属于本国，直接关闭
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        logger.warning("    ⚠️ %s: 关闭 BrowserContext 失败: %s", country_code, e)
+            else:
+                # 上下文会被其他国家借用，成功时清空本国的 Cookie 再放回，避免地区 Cookie 串到其他国家的页面；
+                # 失败（频率限制、重试等）的上下文可能带有异常状态，丢弃后换一个新的放回池中
+                if succeeded:
+                    try:
+                        await context.clear_cookies()
+                    except Exception as e:
+                        logger.warning("    ⚠️ %s: 清空 Cookie 失败: %s", country_code, e)
+                        succeeded = False
+                if not succeeded:
+                    if context is not None:
+                        try:
+                            await context.close()
+                        except Exception as e:
+                            logger.warning("    ⚠️ %s: 关闭 BrowserContext 失败: %s", country_code, e)
+                    try:
+                        context = await new_scrape_context(browser)
+                    except Exception as e:
+                        # 不把已关闭的上下文放回池中，放回 None 由下一次借用时重新创建
+                        logger.warning("    ⚠️ %s: 重建 BrowserContext 失败，下次借用时重试: %s", country_code, e)
+                        context = None
+                context_pool.put_nowait(context)
     
     return None
 
-async def main():
-    """主函数：并发获取各国 Spotify 价格"""
-    print("🎵 开始获取 Spotify Premium Family 各国价格...")
-    print("🚀 使用并发模式，同时处理多个国家")
-    
+async def scrape_all(browser: Browser, country_codes: Dict[str, str], concurrency: int = 5,
+                     max_concurrency: int = 10) -> Tuple[Dict[str, Any], List[str]]:
+    """在同一个浏览器实例上以自适应并发抓取所有国家，返回 (结果, 失败国家列表)"""
+    global _LIMITER
     results = {}
     failed_countries = []
+    total_countries = len(country_codes)
+    
+    # 所有国家放入队列，由固定数量的工作协程持续领取；
+    # 与按批 gather 相比，不必等整批中最慢的国家完成，空出的并发槽位会立即开始下一个国家
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, (country_code, country_name) in enumerate(country_codes.items()):
+        queue.put_nowait((index, country_code, country_name))
+    
+    # 并发数从 concurrency 开始，遇到 429 时减少、连续成功时增加，不超过 max_concurrency
+    limiter = AdaptiveSemaphore(concurrency, max_permits=max(concurrency, max_concurrency))
+    
+    # 每个工作协程对应一个可复用的 BrowserContext，避免每个国家都新建、销毁上下文；
+    # 工作协程按并发上限创建，实际同时处理的国家数由 limiter 控制
+    worker_count = min(max(concurrency, max_concurrency), total_countries)
+    # 池中的 None 表示重建失败的位置，借用时再创建
+    context_pool: asyncio.Queue = asyncio.Queue()
+    for _ in range(worker_count):
+        context_pool.put_nowait(await new_scrape_context(browser))
+    
+    async def process_country(country_code: str, country_name: str, index: int) -> bool:
+        """处理单个国家并记录结果"""
+        logger.info("\n🌍 开始处理: %s/%s - %s (%s)", index+1, total_countries, country_code, country_name)
+        
+        # 获取该国家的价格
+        country_data = await get_spotify_prices_for_country(browser, context_pool, country_code, country_name)
+        
+        if country_data:
+            results[country_code] = country_data
+            logger.info("✅ %s: 成功获取 %s 个套餐", country_code, len(country_data['plans']))
+            
+            # 显示获取到的套餐简要信息
+            for plan in country_data['plans']:
+                logger.info("    📦 %s: %s", plan.get('plan', 'Unknown'), plan.get('price', 'N/A'))
+            
+            return True
+        else:
+            failed_countries.append(f"{country_code} ({country_name})")
+            logger.warning("❌ %s: 获取失败", country_code)
+            return False
+    
+    async def worker():
+        """工作协程：依次领取队列中的国家直到队列为空"""
+        while True:
+            # 先取得并发许可再领取国家；请求节奏由 limiter 和 429 退避共同控制
+            async with limiter:
+                try:
+                    index, country_code, country_name = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                
+                try:
+                    success = await process_country(country_code, country_name, index)
+                    logger.info("📊 完成: %s %s", country_code, '✅' if success else '❌')
+                except Exception as e:
+                    logger.warning("❌ %s: 处理时发生异常: %s", country_code, e)
+    
+    load_static_probe()
+    
+    logger.info("🚀 开始并发处理 %s 个国家（初始并发数: %s，上限: %s）...", total_countries, limiter.permits, worker_count)
+    _LIMITER = limiter
+    try:
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+    finally:
+        _LIMITER = None
+        logger.info("🔧 本次抓取共遇到 %s 次频率限制，结束时并发数为 %s", limiter.rate_limited_count, limiter.permits)
+        while not context_pool.empty():
+            context = context_pool.get_nowait()
+            if context is not None:
+                await context.close()
+        save_static_probe()
     
-    total_countries = len(COUNTRY_CODES)
-    max_concurrent = 5  # 最大并发数，避免过多请求
+    return results, failed_countries
+
+async def main(rescan: bool = False):
+    """主函数：并发获取各国 Spotify 价格"""
+    logger.info("🎵 开始获取 Spotify Premium Family 各国价格...")
+    logger.info("🚀 使用并发模式，同时处理多个国家")
+    
+    max_concurrent = 5  # 初始并发数，运行中根据 429 情况在 1~10 之间自动调整
     
     async with async_playwright() as p:
         # 启动浏览器
@@ -808,70 +1350,7 @@ async def main():
         )
         
         try:
-            # 创建信号量来限制并发数
-            semaphore = asyncio.Semaphore(max_concurrent)
-            
-            async def process_country_with_semaphore(country_code: str, country_name: str, index: int):
-                """使用信号量控制并发的国家处理函数"""
-                async with semaphore:
-                    print(f"\n🌍 开始处理: {index+1}/{total_countries} - {country_code} ({country_name})")
-                    
-                    # 获取该国家的价格
-                    country_data = await get_spotify_prices_for_country(browser, country_code, country_name)
-                    
-                    if country_data:
-                        results[country_code] = country_data
-                        print(f"✅ {country_code}: 成功获取 {len(country_data['plans'])} 个套餐")
-                        
-                        # 显示获取到的套餐简要信息
-                        for plan in country_data['plans']:
-                            print(f"    📦 {plan.get('plan', 'Unknown')}: {plan.get('price', 'N/A')}")
-                        
-                        return True, country_code, country_name
-                    else:
-                        failed_countries.append(f"{country_code} ({country_name})")
-                        print(f"❌ {country_code}: 获取失败")
-                        return False, country_code, country_name
-            
-            # 创建所有任务
-            tasks = []
-            for i, (country_code, country_name) in enumerate(COUNTRY_CODES.items()):
-                task = process_country_with_semaphore(country_code, country_name, i)
-                tasks.append(task)
-            
-            # 使用 asyncio.gather 并发执行所有任务
-            print(f"🚀 开始并发处理 {total_countries} 个国家（最大并发数: {max_concurrent}）...")
-            
-            # 可以选择性地分批处理以避免过载
-            batch_size = 20  # 每批处理20个国家
-            
-            for i in range(0, len(tasks), batch_size):
-                batch = tasks[i:i+batch_size]
-                batch_start = i + 1
-                batch_end = min(i + batch_size, len(tasks))
-                
-                print(f"\n📦 处理批次 {batch_start}-{batch_end}/{total_countries}")
-                
-                # 并发执行当前批次
-                batch_results = await asyncio.gather(*batch, return_exceptions=True)
-                
-                # 处理批次结果
-                for result in batch_results:
-                    if isinstance(result, Exception):
-                        print(f"❌ 批次中发生异常: {result}")
-                    elif isinstance(result, tuple) and len(result) == 3:
-                        success, country_code, country_name = result
-                        if success:
-                            print(f"📊 批次完成: {country_code} ✅")
-                        else:
-                            print(f"📊 批次完成: {country_code} ❌")
-                
-                # 批次间添加短暂延迟
-                if i + batch_size < len(tasks):
-                    delay = random.uniform(2, 5)
-                    print(f"⏱️  批次间等待 {delay:.1f} 秒...")
-                    await asyncio.sleep(delay)
-                
+            results, failed_countries = await scrape_all(browser, COUNTRY_CODES, max_concurrent)
         finally:
             await browser.close()
     
@@ -882,48 +1361,73 @@ async def main():
     
     # 确保归档目录结构存在
     archive_dir = 'archive'
-    if not os.path.exists(archive_dir):
-        os.makedirs(archive_dir)
+    os.makedirs(archive_dir, exist_ok=True)
     
-    # 检查并迁移现有的归档文件到年份目录
-    migrate_existing_archive_files(archive_dir)
+    # 检查并迁移现有的归档文件到年份目录；已有归档索引说明之前的运行已完成迁移
+    if rescan or not os.path.exists(get_archive_index_path(archive_dir)):
+        migrate_existing_archive_files(archive_dir)
     
     # 根据时间戳创建年份子目录
     year_archive_dir = create_archive_directory_structure(archive_dir, timestamp)
     
+    # 只序列化一次，归档版本和最新版本写入相同的字节
+    payload = orjson.dumps(results, option=orjson.OPT_INDENT_2)
+    
     # 保存带时间戳的版本到对应年份归档目录
     archive_file = os.path.join(year_archive_dir, output_file)
-    with open(archive_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    with open(archive_file, 'wb') as f:
+        f.write(payload)
     
     # 保存最新版本（供转换器使用）
-    with open(output_file_latest, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    with open(output_file_latest, 'wb') as f:
+        f.write(payload)
     
     # 获取归档统计信息
-    archive_stats = get_archive_statistics(archive_dir)
+    archive_stats = get_archive_statistics(archive_dir, rescan=rescan)
     
     # 打印统计信息
-    print(f"\n" + "="*60)
-    print(f"🎉 并发爬取完成！")
-    print(f"✅ 成功: {len(results)} 个国家")
-    print(f"❌ 失败: {len(failed_countries)} 个国家")
-    print(f"📁 历史版本已保存到: {archive_file}")
-    print(f"📁 最新版本已保存到: {output_file_latest}")
-    print(f"🗂️  归档统计: 共 {archive_stats['total_files']} 个文件，分布在 {len(archive_stats['years'])} 个年份")
+    logger.info("\n" + "=" * 60)
+    logger.info("🎉 并发爬取完成！")
+    logger.info("✅ 成功: %s 个国家", len(results))
+    logger.info("❌ 失败: %s 个国家", len(failed_countries))
+    logger.info("📁 历史版本已保存到: %s", archive_file)
+    logger.info("📁 最新版本已保存到: %s", output_file_latest)
+    logger.info("🗂️  归档统计: 共 %s 个文件，分布在 %s 个年份", archive_stats['total_files'], len(archive_stats['years']))
     
     # 显示每年的文件数量
     for year_key, year_data in sorted(archive_stats['years'].items(), reverse=True):
-        print(f"    {year_key}: {year_data['count']} 个文件")
+        logger.info("    %s: %s 个文件", year_key, year_data['count'])
     
     if failed_countries:
-        print(f"\n❌ 失败的国家: {', '.join(failed_countries)}")
+        logger.warning("\n❌ 失败的国家: %s", ', '.join(failed_countries))
     
     return results
 
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='获取 Spotify Premium 各国价格')
+    parser.add_argument('--rescan', action='store_true', help='忽略归档索引，重新迁移并统计所有归档文件')
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
+    args = parse_args()
+    
+    # 日志经队列交给后台线程格式化和输出，并发抓取时协程不会被终端 I/O 阻塞
+    log_queue = SimpleQueue()
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(log_queue)])
+    log_listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    log_listener.start()
+    
+    # 有 uvloop 时使用基于 libuv 的事件循环，降低 Playwright 驱动通信和并发页面的调度开销
+    if uvloop is not None:
+        uvloop.install()
+    
     # 运行爬虫
-    results = asyncio.run(main())
+    try:
+        results = asyncio.run(main(rescan=args.rescan))
+    finally:
+        # 停止监听线程前会输出队列中剩余的日志，之后的统计信息直接打印
+        log_listener.stop()
     
     # 可选：显示一些样本数据
     if results:
@@ -954,9 +1458,13 @@ if __name__ == '__main__':
             "大洋洲": ["AU", "FJ", "KI", "MH", "FM", "NR", "NZ", "PW", "PG", "WS", "SB", "TO", "TV", "VU"]
         }
         
+        # 国家代码 -> 地区的反向映射，一次遍历结果即可统计各地区成功数
+        region_of = {code: region for region, countries in regions.items() for code in countries}
+        successful_by_region = Counter(region_of[code] for code in results if code in region_of)
+        
         print(f"\n🌍 按地区统计:")
         for region, countries in regions.items():
-            successful_in_region = sum(1 for code in countries if code in results)
+            successful_in_region = successful_by_region[region]
             total_in_region = len(countries)
             region_success_rate = successful_in_region / total_in_region * 100 if total_in_region > 0 else 0
             print(f"  {region}: {successful_in_region}/{total_in_region} ({region_success_rate:.1f}%)")
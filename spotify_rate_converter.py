@@ -1,10 +1,20 @@
+import argparse
+import heapq
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import os
+import sys
+import time
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from datetime import datetime  # 添加这一行
+from functools import lru_cache
 import re
 
+from changelog_archiver import atomic_write
+
 
 # --- Configuration ---
 
@@ -34,6 +44,21 @@ API_URL_TEMPLATE = "https://openexchangerates.org/api/latest.json?app_id={}"
 INPUT_JSON_PATH = 'spotify_prices_all_countries.json'
 OUTPUT_JSON_PATH = 'spotify_prices_cny_sorted.json'
 
+# 复用同一个 Session，多个密钥依次尝试时共享 TCP/TLS 连接；
+# 遇到频率限制或服务端错误时按指数退避自动重试两次
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+))
+
+# 汇率缓存文件及有效期（免费版汇率每小时更新一次）
+RATES_CACHE_PATH = '.rates_cache.json'
+RATES_CACHE_TTL = 60 * 60
+# 所有 API 密钥都失败时最多退回到 8 天内的缓存汇率（定时任务每周运行一次，可以用上次运行的汇率），更旧的汇率宁可不生成结果
+RATES_STALE_MAX_AGE = 8 * 24 * 60 * 60
+
 
 # 国家名称中英文对照表
 COUNTRY_NAMES_CN = {
@@ -69,7 +94,6 @@ COUNTRY_NAMES_CN = {
     'CZ': '捷克',
     'HU': '匈牙利',
     'RO': '罗马尼亚',
-    'TR': '土耳其',
     'HK': '香港',
     'SG': '新加坡',
     'IL': '以色列',
@@ -98,24 +122,19 @@ COUNTRY_NAMES_CN = {
 
 # --- Functions ---
 
-def extract_price_from_text(price_text, currency):
-    """从价格文本中提取数字价格"""
-    if not price_text or not isinstance(price_text, str):
-        return None
-    
-    # 不同货币的符号
-    currency_symbols = {
-        'USD': r'\$',
-        'EUR': r'€',
-        'GBP': r'£',
-        'CNY': r'¥|yuan',
-        'JPY': r'¥',
-    }
-    
-    # 获取当前货币的符号，如果没有找到则使用通用模式
-    symbol = currency_symbols.get(currency, r'[¥$€£]')
-    
-    # 更精确的匹配模式
+# 不同货币的符号，未列出的货币使用通用模式
+_PRICE_SYMBOLS = {
+    'USD': r'\$',
+    'EUR': r'€',
+    'GBP': r'£',
+    'CNY': r'¥|yuan',
+    'JPY': r'¥',
+}
+_DEFAULT_PRICE_SYMBOL = r'[¥$€£]'
+
+
+def _build_price_patterns(symbol):
+    """按匹配优先级编译某个货币符号的价格模式"""
     patterns = [
         # 匹配 $6,49 格式（欧洲/拉美用逗号作小数点）
         rf'{symbol}\s*(\d+),(\d{{1,2}})',  # $6,49
@@ -130,9 +149,24 @@ def extract_price_from_text(price_text, currency):
         rf'(\d+)\.(\d{{1,2}})\s*{symbol}',  # 6.49$
         rf'(\d+)\s*{symbol}',  # 6$
     ]
+    return tuple(re.compile(pattern) for pattern in patterns)
+
+
+# 价格模式在导入时编译一次，提取价格时按货币直接取用
+_PRICE_PATTERNS = {currency: _build_price_patterns(symbol) for currency, symbol in _PRICE_SYMBOLS.items()}
+_DEFAULT_PRICE_PATTERNS = _build_price_patterns(_DEFAULT_PRICE_SYMBOL)
+
+
+def extract_price_from_text(price_text, currency):
+    """从价格文本中提取数字价格"""
+    if not price_text or not isinstance(price_text, str):
+        return None
+    
+    # 获取当前货币的预编译模式，如果没有找到则使用通用模式
+    patterns = _PRICE_PATTERNS.get(currency, _DEFAULT_PRICE_PATTERNS)
     
     for i, pattern in enumerate(patterns):
-        match = re.search(pattern, price_text)
+        match = pattern.search(price_text)
         if match:
             try:
                 if len(match.groups()) == 2:
@@ -158,145 +192,180 @@ def extract_price_from_text(price_text, currency):
     print(f"无法从 '{price_text}' 中提取价格")
     return None
 
+
+# 套餐名称标准化映射规则（小写名称 -> 标准名称）
+_PLAN_MAP = {
+    # Individual/Personal plans
+    'premium individual': 'Premium Individual',
+    'premium personal': 'Premium Individual', 
+    'premium個人': 'Premium Individual',
+    'premium 個人': 'Premium Individual',
+    'premium个人': 'Premium Individual',
+    'premium 个人': 'Premium Individual',
+    # 法语
+    'premium personnel': 'Premium Individual',
+    # 芬兰语
+    'yksilö-premium': 'Premium Individual',
+    # 匈牙利语
+    'egyéni premium csomag': 'Premium Individual',
+    # 韩语/日语
+    'premium standard': 'Premium Individual',
+    # 斯瓦希里语
+    'premium ya binafsi': 'Premium Individual',
+    
+    # Student plans
+    'premium para estudiantes': 'Premium Student',
+    'premium student': 'Premium Student',
+    'premium estudiantil': 'Premium Student',
+    'premium universitário': 'Premium Student',
+    'premium étudiant': 'Premium Student',
+    'premium studenten': 'Premium Student',
+    'premium学生': 'Premium Student',
+    'premium 学生': 'Premium Student',
+    'premium大学生': 'Premium Student',
+    'premium 大学生': 'Premium Student',
+    'premium 學生': 'Premium Student',
+    'premium學生': 'Premium Student',
+    # 法语
+    'premium étudiants': 'Premium Student',
+    # 芬兰语
+    'opiskelija‑premium': 'Premium Student',
+    # 匈牙利语
+    'hallgatói premium csomag': 'Premium Student',
+    # 摩洛哥法语
+    'premium étudiants': 'Premium Student',
+    
+    # Duo plans
+    'premium duo': 'Premium Duo',
+    'premium para dois': 'Premium Duo',
+    'premium couple': 'Premium Duo',
+    'premium雙人': 'Premium Duo',
+    'premium 雙人': 'Premium Duo',
+    'premium双人': 'Premium Duo',
+    'premium 双人': 'Premium Duo',
+    # 芬兰语
+    'duo‑premium': 'Premium Duo',
+    # 匈牙利语
+    'premium duo csomag': 'Premium Duo',
+    
+    # Family plans
+    'premium familiar': 'Premium Family',
+    'premium family': 'Premium Family',
+    'premium família': 'Premium Family',
+    'premium famille': 'Premium Family',
+    'premium familie': 'Premium Family',
+    'premium家庭': 'Premium Family',
+    'premium 家庭': 'Premium Family',
+    'premium家族': 'Premium Family',
+    'premium 家族': 'Premium Family',
+    # 芬兰语
+    'perhe‑premium': 'Premium Family',
+    # 匈牙利语
+    'családi premium csomag': 'Premium Family',
+    # 斯瓦希里语
+    'premium ya familia': 'Premium Family',
+    
+    # Special/Other plans
+    'premium basic': 'Premium Basic',  # 韩国特殊套餐
+    'premium lite': 'Premium Lite',    # 哥伦比亚等
+    
+    # Free plans
+    'spotify free': 'Spotify Free',
+    'free': 'Spotify Free',
+    'gratuito': 'Spotify Free',
+    'gratuit': 'Spotify Free',
+    '免費': 'Spotify Free',
+    '免费': 'Spotify Free',
+}
+
+
+def _keyword_regex(keywords):
+    """把关键词列表编译为一个子串匹配的正则，一次扫描即可判断是否包含任一关键词"""
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+
+# 模糊匹配的关键词分组，按优先级排列（名称中还需含有 premium）
+_PREMIUM_KEYWORD_CATEGORIES = (
+    (_keyword_regex(['individual', 'personal', 'personnel', 'yksilö', 'egyéni', 'binafsi']), 'Premium Individual'),
+    (_keyword_regex(['estudiante', 'student', 'étudiant', 'studenten', 'opiskelija', 'hallgatói', '学生', '學生', '大学生']), 'Premium Student'),
+    (_keyword_regex(['duo', 'couple', '双人', '雙人']), 'Premium Duo'),
+    (_keyword_regex(['familiar', 'family', 'família', 'famille', 'familie', 'perhe', 'családi', 'familia', '家庭', '家族']), 'Premium Family'),
+)
+_FREE_KEYWORD_RE = _keyword_regex(['free', 'gratuito', 'gratuit', '免費', '免费'])
+
+
+@lru_cache(maxsize=1024)
 def standardize_plan_name(plan_name):
-    """标准化套餐名称为英文统一格式"""
+    """标准化套餐名称为英文统一格式（各国套餐名称高度重复，结果按名称缓存）"""
     if not plan_name:
         return plan_name
     
     # 转换为小写用于匹配
     plan_lower = plan_name.lower()
     
-    # 定义标准化映射规则
-    standardization_map = {
-        # Individual/Personal plans
-        'premium individual': 'Premium Individual',
-        'premium personal': 'Premium Individual', 
-        'premium個人': 'Premium Individual',
-        'premium 個人': 'Premium Individual',
-        'premium个人': 'Premium Individual',
-        'premium 个人': 'Premium Individual',
-        # 法语
-        'premium personnel': 'Premium Individual',
-        # 芬兰语
-        'yksilö-premium': 'Premium Individual',
-        # 匈牙利语
-        'egyéni premium csomag': 'Premium Individual',
-        # 韩语/日语
-        'premium standard': 'Premium Individual',
-        # 斯瓦希里语
-        'premium ya binafsi': 'Premium Individual',
-        
-        # Student plans
-        'premium para estudiantes': 'Premium Student',
-        'premium student': 'Premium Student',
-        'premium estudiantil': 'Premium Student',
-        'premium universitário': 'Premium Student',
-        'premium étudiant': 'Premium Student',
-        'premium studenten': 'Premium Student',
-        'premium学生': 'Premium Student',
-        'premium 学生': 'Premium Student',
-        'premium大学生': 'Premium Student',
-        'premium 大学生': 'Premium Student',
-        'premium 學生': 'Premium Student',
-        'premium學生': 'Premium Student',
-        # 法语
-        'premium étudiants': 'Premium Student',
-        # 芬兰语
-        'opiskelija‑premium': 'Premium Student',
-        # 匈牙利语
-        'hallgatói premium csomag': 'Premium Student',
-        # 摩洛哥法语
-        'premium étudiants': 'Premium Student',
-        
-        # Duo plans
-        'premium duo': 'Premium Duo',
-        'premium para dois': 'Premium Duo',
-        'premium couple': 'Premium Duo',
-        'premium雙人': 'Premium Duo',
-        'premium 雙人': 'Premium Duo',
-        'premium双人': 'Premium Duo',
-        'premium 双人': 'Premium Duo',
-        # 芬兰语
-        'duo‑premium': 'Premium Duo',
-        # 匈牙利语
-        'premium duo csomag': 'Premium Duo',
-        
-        # Family plans
-        'premium familiar': 'Premium Family',
-        'premium family': 'Premium Family',
-        'premium família': 'Premium Family',
-        'premium famille': 'Premium Family',
-        'premium familie': 'Premium Family',
-        'premium家庭': 'Premium Family',
-        'premium 家庭': 'Premium Family',
-        'premium家族': 'Premium Family',
-        'premium 家族': 'Premium Family',
-        # 芬兰语
-        'perhe‑premium': 'Premium Family',
-        # 匈牙利语
-        'családi premium csomag': 'Premium Family',
-        # 斯瓦希里语
-        'premium ya familia': 'Premium Family',
-        
-        # Special/Other plans
-        'premium basic': 'Premium Basic',  # 韩国特殊套餐
-        'premium lite': 'Premium Lite',    # 哥伦比亚等
-        
-        # Free plans
-        'spotify free': 'Spotify Free',
-        'free': 'Spotify Free',
-        'gratuito': 'Spotify Free',
-        'gratuit': 'Spotify Free',
-        '免費': 'Spotify Free',
-        '免费': 'Spotify Free',
-    }
-    
     # 直接匹配
-    if plan_lower in standardization_map:
-        return standardization_map[plan_lower]
-    
-    # 模糊匹配（包含关键词）
-    if any(keyword in plan_lower for keyword in ['individual', 'personal', 'personnel', 'yksilö', 'egyéni', 'binafsi']):
-        if 'premium' in plan_lower:
-            return 'Premium Individual'
-    
-    if any(keyword in plan_lower for keyword in ['estudiante', 'student', 'étudiant', 'studenten', 'opiskelija', 'hallgatói', '学生', '學生', '大学生']):
-        if 'premium' in plan_lower:
-            return 'Premium Student'
-    
-    if any(keyword in plan_lower for keyword in ['duo', 'couple', '双人', '雙人']):
-        if 'premium' in plan_lower:
-            return 'Premium Duo'
-    
-    if any(keyword in plan_lower for keyword in ['familiar', 'family', 'família', 'famille', 'familie', 'perhe', 'családi', 'familia', '家庭', '家族']):
-        if 'premium' in plan_lower:
-            return 'Premium Family'
-    
-    if any(keyword in plan_lower for keyword in ['free', 'gratuito', 'gratuit', '免費', '免费']):
+    standardized = _PLAN_MAP.get(plan_lower)
+    if standardized is not None:
+        return standardized
+    
+    # 模糊匹配（包含关键词）：各付费套餐分组都要求名称中含有 premium，只判断一次
+    has_premium = 'premium' in plan_lower
+    if has_premium:
+        for keyword_re, category in _PREMIUM_KEYWORD_CATEGORIES:
+            if keyword_re.search(plan_lower):
+                return category
+    
+    if _FREE_KEYWORD_RE.search(plan_lower):
         return 'Spotify Free'
     
     # 特殊处理
-    if 'basic' in plan_lower and 'premium' in plan_lower:
-        return 'Premium Basic'
+    if has_premium:
+        if 'basic' in plan_lower:
+            return 'Premium Basic'
+        if 'lite' in plan_lower:
+            return 'Premium Lite'
     
-    if 'lite' in plan_lower and 'premium' in plan_lower:
-        return 'Premium Lite'
-    
-    # 如果没有匹配到，保持原名称但首字母大写
-    return plan_name.title()
+    # 如果没有匹配到，保持原名称但首字母大写；驻留后各国相同的套餐名共用同一个字符串对象
+    return sys.intern(plan_name.title())
     
 def get_current_date():
     """获取当前日期"""
     return datetime.now().strftime('%Y-%m-%d')
         
-def get_exchange_rates(api_keys, url_template):
-    """获取最新汇率，如果API失败则返回None"""
+def load_cached_rates(max_age=RATES_CACHE_TTL):
+    """读取汇率缓存，不存在或超过 max_age 秒时返回None"""
+    try:
+        if time.time() - os.path.getmtime(RATES_CACHE_PATH) >= max_age:
+            return None
+        with open(RATES_CACHE_PATH, 'r', encoding='utf-8') as f:
+            rates = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return rates if isinstance(rates, dict) and rates else None
+
+
+def save_cached_rates(rates):
+    """原子写入汇率缓存，写入失败不影响本次转换"""
+    try:
+        atomic_write(RATES_CACHE_PATH, json.dumps(rates))
+    except OSError as e:
+        print(f"写入汇率缓存时出错: {e}")
+
+
+def get_exchange_rates(api_keys, url_template, use_cache=True):
+    """获取最新汇率（优先使用一小时内的缓存），返回 (汇率表, 过期汇率的缓存时间)，汇率未过期时第二项为None，全部失败时返回 (None, None)"""
+    if use_cache:
+        cached_rates = load_cached_rates()
+        if cached_rates:
+            print(f"使用缓存的汇率: {RATES_CACHE_PATH}")
+            return cached_rates, None
+    
     rates = None
     for key in api_keys:
         url = url_template.format(key)
         try:
             print(f"正在尝试使用API密钥 ...{key[-4:]} 获取汇率...")
-            response = requests.get(url, timeout=10)
+            response = HTTP_SESSION.get(url, timeout=10)
             response.raise_for_status()
             data = response.json()
             if 'rates' in data:
@@ -304,7 +373,8 @@ def get_exchange_rates(api_keys, url_template):
                 rates = data['rates']
                 if 'USD' not in rates:
                     rates['USD'] = 1.0
-                return rates
+                save_cached_rates(rates)
+                return rates, None
             else:
                 print(f"API 密钥 ...{key[-4:]} 可能无效或受限: {data.get('description')}")
         except requests.exceptions.RequestException as e:
@@ -313,7 +383,24 @@ def get_exchange_rates(api_keys, url_template):
             print(f"使用密钥 ...{key[-4:]} 解码 JSON 响应时出错")
     
     print("无法使用所有提供的 API 密钥获取汇率")
-    return None
+    
+    # 所有密钥都失败时退回到 8 天内的过期汇率缓存，并在输出中注明汇率的时间
+    stale_rates = load_cached_rates(max_age=RATES_STALE_MAX_AGE)
+    if stale_rates:
+        stale_since = datetime.fromtimestamp(os.path.getmtime(RATES_CACHE_PATH)).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"警告：使用已过期的汇率缓存 {RATES_CACHE_PATH}（获取于 {stale_since}）")
+        return stale_rates, stale_since
+    return None, None
+
+
+# 人民币金额保留到分，量化精度只构造一次
+_CENT = Decimal("0.01")
+
+
+@lru_cache(maxsize=1024)
+def _rate_to_decimal(rate):
+    """汇率转换为 Decimal，每个汇率值只转换一次（同一次运行中各国套餐共用汇率表）"""
+    return Decimal(str(rate))
 
 
 def convert_to_cny(amount, currency_code, rates):
@@ -329,7 +416,7 @@ def convert_to_cny(amount, currency_code, rates):
     
     try:
         if currency_code == 'CNY':
-            return amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+            return amount.quantize(_CENT, rounding=ROUND_HALF_UP)
         
         if 'CNY' not in rates:
             print(f"警告：汇率表中未找到 CNY")
@@ -339,33 +426,53 @@ def convert_to_cny(amount, currency_code, rates):
             print(f"警告：汇率表中未找到 {currency_code}")
             return None
         
-        cny_rate = Decimal(str(rates['CNY']))
+        cny_rate = _rate_to_decimal(rates['CNY'])
         
         if currency_code == 'USD':
             cny_amount = amount * cny_rate
         else:
-            original_rate = Decimal(str(rates[currency_code]))
+            original_rate = _rate_to_decimal(rates[currency_code])
             if original_rate == 0:
                 print(f"警告：{currency_code} 的汇率为零")
                 return None
             usd_amount = amount / original_rate
             cny_amount = usd_amount * cny_rate
         
-        return cny_amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return cny_amount.quantize(_CENT, rounding=ROUND_HALF_UP)
     
     except Exception as e:
         print(f"转换 {amount} {currency_code} 到 CNY 时出错: {e}")
         return None
 
 
-def process_spotify_data(data, rates):
-    """处理Spotify价格数据，添加CNY汇率转换"""
-    processed_data = {}
-    
+# standardize_plan_name 已把各语言的家庭套餐统一为英文名称，标准化后的名称只需集合查找
+_FAMILY_PLAN_NAMES = frozenset({'Premium Family'})
+
+
+def _is_family_plan(plan_name):
+    """判断未标准化的原始套餐名称是否为 Premium Family 套餐（支持多语言）"""
+    return ('Premium Family' in plan_name or 'Premium Familiar' in plan_name or
+            'Premium Famille' in plan_name or 'Premium Familie' in plan_name)
+
+
+def _resolve_price(price_text, price_number, currency, rates):
+    """确定套餐价格：price_number 为0或None时从价格文本提取，返回 (格式化的价格数值, CNY价格)"""
+    if price_number is None or not price_number > 0:
+        price_number = extract_price_from_text(price_text, currency)
+        if price_number is None:
+            return None, None
+    
+    cny_price = convert_to_cny(price_number, currency, rates)
+    return format_price_number(price_number), float(cny_price) if cny_price is not None else None
+
+
+def iter_processed_countries(data, rates):
+    """逐个国家处理价格数据并转换为CNY，产出 (国家代码, 处理后的国家数据, Premium Family 套餐或None)"""
     for country_code, country_info in data.items():
         print(f"正在处理 {country_info.get('country_name', country_code)} ({country_code})...")
         
         processed_plans = []
+        family_plan = None
         
         for plan in country_info.get('plans', []):
             plan_name = plan.get('plan', '')
@@ -374,113 +481,73 @@ def process_spotify_data(data, rates):
             # 标准化套餐名称
             standardized_plan_name = standardize_plan_name(plan_name)
             
-            # Create processed plan object
-            processed_plan = {
-                'plan': standardized_plan_name,  # 使用标准化名称
-                'original_plan_name': plan_name,  # 保留原始名称以备参考
-                'currency': currency
-            }
-            
             # Process primary_price and secondary_price
             primary_price = plan.get('primary_price', '')
             secondary_price = plan.get('secondary_price', '')
             price_number = plan.get('price_number')
             
-            # 优先使用 secondary_price
+            # 优先使用 secondary_price，其次 primary_price
             if secondary_price and secondary_price.strip():
-                processed_plan['price'] = secondary_price
-                
-                # 尝试从 price_number 获取价格，如果为0或None则从文本提取
-                if price_number is not None and price_number > 0:
-                    processed_plan['price_number'] = format_price_number(price_number)
-                    cny_price = convert_to_cny(price_number, currency, rates)
-                    if cny_price is not None:
-                        processed_plan['price_cny'] = float(cny_price)
-                    else:
-                        processed_plan['price_cny'] = None
-                else:
-                    # 从 secondary_price 文本中提取价格
-                    extracted_price = extract_price_from_text(secondary_price, currency)
-                    if extracted_price is not None:
-                        processed_plan['price_number'] = format_price_number(extracted_price)
-                        cny_price = convert_to_cny(extracted_price, currency, rates)
-                        if cny_price is not None:
-                            processed_plan['price_cny'] = float(cny_price)
-                        else:
-                            processed_plan['price_cny'] = None
-                    else:
-                        processed_plan['price_number'] = None
-                        processed_plan['price_cny'] = None
-                        
+                price_text = secondary_price
             elif primary_price and primary_price.strip():
-                processed_plan['price'] = primary_price
-                
-                # 尝试从 price_number 获取价格，如果为0或None则从文本提取
-                if price_number is not None and price_number > 0:
-                    processed_plan['price_number'] = format_price_number(price_number)
-                    cny_price = convert_to_cny(price_number, currency, rates)
-                    if cny_price is not None:
-                        processed_plan['price_cny'] = float(cny_price)
-                    else:
-                        processed_plan['price_cny'] = None
-                else:
-                    # 从 primary_price 文本中提取价格
-                    extracted_price = extract_price_from_text(primary_price, currency)
-                    if extracted_price is not None:
-                        processed_plan['price_number'] = format_price_number(extracted_price)
-                        cny_price = convert_to_cny(extracted_price, currency, rates)
-                        if cny_price is not None:
-                            processed_plan['price_cny'] = float(cny_price)
-                        else:
-                            processed_plan['price_cny'] = None
-                    else:
-                        processed_plan['price_number'] = None
-                        processed_plan['price_cny'] = None
+                price_text = primary_price
             else:
-                # No valid price found
-                processed_plan['price'] = ''
-                processed_plan['price_number'] = None
-                processed_plan['price_cny'] = None
+                price_text = ''
             
-            # Copy other fields if needed
-            processed_plan['source'] = plan.get('source', '')
+            if price_text:
+                formatted_number, price_cny = _resolve_price(price_text, price_number, currency, rates)
+            else:
+                # No valid price found
+                formatted_number = None
+                price_cny = None
             
+            # 所有字段确定后一次性构建套餐对象，避免逐键插入
+            processed_plan = {
+                'plan': standardized_plan_name,  # 使用标准化名称
+                'original_plan_name': plan_name,  # 保留原始名称以备参考
+                'currency': currency,
+                'price': price_text,
+                'price_number': formatted_number,
+                'price_cny': price_cny,
+                'source': plan.get('source', '')
+            }
             processed_plans.append(processed_plan)
+            
+            # 处理时顺便记下第一个 Premium Family 套餐，排序时无需再遍历套餐列表
+            if family_plan is None and standardized_plan_name in _FAMILY_PLAN_NAMES:
+                family_plan = processed_plan
         
-        processed_data[country_code] = {
+        yield country_code, {
             'country_code': country_code,
             'country_name': country_info.get('country_name', ''),
             'plans': processed_plans,
             'scraped_at': country_info.get('scraped_at', ''),
             'source_url': country_info.get('source_url', ''),
             'attempt': country_info.get('attempt', 1)
-        }
-    
-    return processed_data
+        }, family_plan
 
-def sort_by_family_plan_cny(processed_data, original_data):
-    """按Premium Family的CNY价格从低到高排序国家，并在JSON前面添加最便宜的10个"""
-    countries_with_family_price = []
+
+def process_spotify_data(data, rates):
+    """处理Spotify价格数据，添加CNY汇率转换"""
+    return {country_code: country_info for country_code, country_info, _ in iter_processed_countries(data, rates)}
+
+def sort_by_family_plan_cny(processed_countries, original_data, rates_stale_since=None):
+    """按Premium Family的CNY价格从低到高排序 iter_processed_countries 产出的国家，并在JSON前面添加最便宜的10个"""
+    family_heap = []
     countries_without_family_price = []
     
-    for country_code, country_info in processed_data.items():
-        family_plan = None
-        
-        # Find Premium Family plan (支持多语言)
-        for plan in country_info.get('plans', []):
-            plan_name = plan.get('plan', '')
-            if ('Premium Family' in plan_name or 'Premium Familiar' in plan_name or 
-                'Premium Famille' in plan_name or 'Premium Familie' in plan_name):
-                family_plan = plan
-                break
-        
+    for index, (country_code, country_info, family_plan) in enumerate(processed_countries):
         if family_plan and family_plan.get('price_cny') is not None:
-            countries_with_family_price.append((country_code, family_plan['price_cny'], country_info, family_plan))
+            # 价格相同时按原始顺序排列，与稳定排序的结果一致
+            heapq.heappush(family_heap, (family_plan['price_cny'], index, country_code, country_info, family_plan))
         else:
             countries_without_family_price.append((country_code, country_info))
     
-    # Sort countries with family plan by CNY price
-    countries_with_family_price.sort(key=lambda x: x[1])
+    # 按CNY价格从低到高依次取出
+    countries_with_family_price = []
+    while family_heap:
+        price_cny, _, country_code, country_info, family_plan = heapq.heappop(family_heap)
+        countries_with_family_price.append((country_code, price_cny, country_info, family_plan))
     
     # Create sorted result with top 10 cheapest Premium Family plans first
     sorted_data = {}
@@ -488,14 +555,15 @@ def sort_by_family_plan_cny(processed_data, original_data):
     # Add top 10 cheapest Premium Family summary
     top_10_cheapest = []
     for i, (country_code, price_cny, country_info, family_plan) in enumerate(countries_with_family_price[:10]):
-        country_name_cn = COUNTRY_NAMES_CN.get(country_code, country_info.get('country_name', country_code))
+        country_name_cn = COUNTRY_NAMES_CN.get(country_code)
+        if country_name_cn is None:
+            country_name_cn = country_info.get('country_name', country_code)
         # 获取原始 price_number 数值进行格式化
         original_price_number = None
         for original_plan in original_data.get(country_code, {}).get('plans', []):
             plan_name = original_plan.get('plan', '')
             # 支持多语言的家庭套餐名称
-            if ('Premium Family' in plan_name or 'Premium Familiar' in plan_name or 
-                'Premium Famille' in plan_name or 'Premium Familie' in plan_name):
+            if _is_family_plan(plan_name):
                 original_price_number = original_plan.get('price_number')
                 break
         
@@ -517,6 +585,9 @@ def sort_by_family_plan_cny(processed_data, original_data):
         'updated_at': get_current_date(), 
         'data': top_10_cheapest
     }
+    # 使用过期汇率时注明汇率的获取时间
+    if rates_stale_since:
+        sorted_data['_top_10_cheapest_premium_family']['rates_stale_since'] = rates_stale_since
     
     # Add countries with Premium Family plan (sorted by price)
     for country_code, price_cny, country_info, family_plan in countries_with_family_price:
@@ -534,25 +605,47 @@ def format_price_number(price_number):
     if price_number is None:
         return None
     
-    # 如果是整数（包括像 1300.0 这样的浮点数），格式化为整数并添加千位分隔符
+    # 像 1300.0 这样的整数值浮点数先转为整数，不显示小数点；有小数的数字保留小数位
     if isinstance(price_number, float) and price_number.is_integer():
-        return f"{int(price_number):,}"
-    elif isinstance(price_number, int):
-        return f"{price_number:,}"
-    else:
-        # 对于有小数的数字，保留小数位并添加千位分隔符
-        return f"{price_number:,}"
+        price_number = int(price_number)
+    return f"{price_number:,}"
+
+
+def _dumps_indented(value):
+    """序列化为缩进为2的 UTF-8 JSON 字节"""
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2)
+
+
+def write_json_object(f, items):
+    """逐个国家向二进制文件写出JSON对象，输出与 json.dump(..., ensure_ascii=False, indent=2) 一致，但每次只序列化一个条目"""
+    first = True
+    f.write(b'{')
+    for key, value in items:
+        # 嵌套内容整体缩进一级；JSON 字符串中的换行已被转义，不会受影响
+        entry = _dumps_indented(value).replace(b'\n', b'\n  ')
+        f.write(b'\n  ' if first else b',\n  ')
+        f.write(_dumps_indented(key) + b': ' + entry)
+        first = False
+    f.write(b'}' if first else b'\n}')
 
 
 # --- Main Script ---
 
-def main():
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Spotify价格汇率转换器')
+    parser.add_argument('--refresh-rates', action='store_true', help='跳过汇率缓存，强制重新获取汇率')
+    return parser.parse_args(argv)
+
+
+def main(refresh_rates=False):
     print("Spotify价格汇率转换器")
     print("=" * 50)
     
     # 1. Get exchange rates
     print("1. 获取汇率...")
-    exchange_rates = get_exchange_rates(API_KEYS, API_URL_TEMPLATE)
+    # --refresh-rates 跳过缓存，强制重新获取汇率
+    exchange_rates, rates_stale_since = get_exchange_rates(API_KEYS, API_URL_TEMPLATE, use_cache=not refresh_rates)
     if exchange_rates:
         print(f"成功获取汇率。基础货币: USD，找到 {len(exchange_rates)} 个汇率")
         if 'CNY' in exchange_rates:
@@ -566,32 +659,30 @@ def main():
     # 2. Load Spotify data
     print(f"\n2. 从 {INPUT_JSON_PATH} 加载Spotify价格数据...")
     try:
-        with open(INPUT_JSON_PATH, 'r', encoding='utf-8') as f:
-            spotify_data = json.load(f)
+        # 以字节读取，由 orjson 直接解码 UTF-8
+        with open(INPUT_JSON_PATH, 'rb') as f:
+            spotify_data = orjson.loads(f.read())
         print(f"成功加载数据，包含 {len(spotify_data)} 个国家")
     except FileNotFoundError:
         print(f"错误：输入文件未找到: {INPUT_JSON_PATH}")
         return
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         print(f"错误：JSON解码失败: {e}")
         return
     except Exception as e:
         print(f"加载文件时发生错误: {e}")
         return
     
-    # 3. Process data (add CNY conversion)
-    print("\n3. 处理价格数据并转换为人民币...")
-    processed_data = process_spotify_data(spotify_data, exchange_rates)
-    
-    # 4. Sort by Premium Family CNY price
-    print("\n4. 按Premium Family的CNY价格排序...")
-    sorted_data = sort_by_family_plan_cny(processed_data, spotify_data)
+    # 3. Process data (add CNY conversion) and sort by Premium Family CNY price in one pass
+    print("\n3. 处理价格数据并转换为人民币，按Premium Family的CNY价格排序...")
+    sorted_data = sort_by_family_plan_cny(iter_processed_countries(spotify_data, exchange_rates), spotify_data,
+                                         rates_stale_since)
     
-    # 5. Save processed data
-    print(f"\n5. 保存处理后的数据到 {OUTPUT_JSON_PATH}...")
+    # 4. Save processed data
+    print(f"\n4. 保存处理后的数据到 {OUTPUT_JSON_PATH}...")
     try:
-        with open(OUTPUT_JSON_PATH, 'w', encoding='utf-8') as f:
-            json.dump(sorted_data, f, ensure_ascii=False, indent=2)
+        with open(OUTPUT_JSON_PATH, 'wb') as f:
+            write_json_object(f, sorted_data.items())
         print("处理完成！")
         
         # Show top 10 cheapest Premium Family plans
@@ -608,10 +699,10 @@ def main():
                     continue
                 for plan in country_info.get('plans', []):
                     plan_name = plan.get('plan', '')
-                    if (('Premium Family' in plan_name or 'Premium Familiar' in plan_name or 
-                         'Premium Famille' in plan_name or 'Premium Familie' in plan_name) and 
-                        plan.get('price_cny') is not None):
-                        country_name_cn = COUNTRY_NAMES_CN.get(country_code, country_info['country_name'])
+                    if plan_name in _FAMILY_PLAN_NAMES and plan.get('price_cny') is not None:
+                        country_name_cn = COUNTRY_NAMES_CN.get(country_code)
+                        if country_name_cn is None:
+                            country_name_cn = country_info['country_name']
                         print(f"{count+1:2d}. {country_name_cn:15s} ({country_code}): "
                               f"¥{plan['price_cny']:7.2f} ({plan['currency']} {plan.get('price_number', 'N/A')})")
                         count += 1
@@ -625,4 +716,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(refresh_rates=args.refresh_rates)